@@ -7,32 +7,98 @@ Based on the Holy Guacamole architecture
 import os
 import sys
 import json
+import re
+import time
+import asyncio
+import collections
+import contextvars
+import heapq
+import itertools
+import queue
 import random
+import hashlib
+import threading
+import importlib.util
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from typing import Dict, Any, Optional, List, Tuple
 from dataclasses import dataclass
 
+# Startup profile: (phase, seconds) in the order the phases ran
+MODULE_START = time.perf_counter()
+STARTUP_PROFILE = []
+
+@contextmanager
+def startup_phase(name):
+    """Record how long a startup phase takes (phases that raise aren't recorded)"""
+    start = time.perf_counter()
+    yield
+    STARTUP_PROFILE.append((name, time.perf_counter() - start))
+
 # SignalWire imports
-from signalwire_agents import AgentBase
-from signalwire_agents.core.function_result import SwaigFunctionResult
+with startup_phase("import signalwire_agents"):
+    from signalwire_agents import AgentBase
+    from signalwire_agents.core.function_result import SwaigFunctionResult
 
-# Optional imports for advanced features
+# Optional imports for advanced features. scikit-learn accounts for most of
+# the import time, so it is only imported when the drink matcher is fitted.
 try:
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
-    import numpy as np
-    HAS_SKLEARN = True
+    with startup_phase("import numpy"):
+        import numpy as np
+    HAS_SKLEARN = importlib.util.find_spec("sklearn") is not None
 except ImportError:
     HAS_SKLEARN = False
+if not HAS_SKLEARN:
     print("Warning: scikit-learn not installed. Fuzzy drink matching disabled.")
 
 # Try to load dotenv if available
 try:
-    from dotenv import load_dotenv
-    load_dotenv()
+    with startup_phase("import dotenv"):
+        from dotenv import load_dotenv
+        load_dotenv()
 except ImportError:
     print("Warning: python-dotenv not installed. Using environment variables only.")
 
+# JSON backends, fastest first: name -> (encode(obj, sort_keys=False) -> bytes,
+# decode(bytes or str)). orjson and msgspec are optional; stdlib json is the
+# fallback. BARTENDER_JSON picks one explicitly.
+def _stdlib_json_encode(obj, sort_keys=False):
+    return json.dumps(obj, sort_keys=sort_keys, default=str, ensure_ascii=False,
+                      separators=(",", ":")).encode()
+
+JSON_BACKENDS = {}
+try:
+    with startup_phase("import orjson"):
+        import orjson
+    
+    def _orjson_encode(obj, sort_keys=False):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=str, option=option)
+    
+    JSON_BACKENDS["orjson"] = (_orjson_encode, orjson.loads)
+except ImportError:
+    pass
+try:
+    with startup_phase("import msgspec"):
+        import msgspec
+    _msgspec_encoders = (msgspec.json.Encoder(enc_hook=str),
+                         msgspec.json.Encoder(enc_hook=str, order="sorted"))
+    
+    def _msgspec_encode(obj, sort_keys=False):
+        return _msgspec_encoders[sort_keys].encode(obj)
+    
+    JSON_BACKENDS["msgspec"] = (_msgspec_encode, msgspec.json.decode)
+except (ImportError, TypeError):
+    # TypeError: msgspec too old for sorted encoding
+    pass
+JSON_BACKENDS["json"] = (_stdlib_json_encode, json.loads)
+
+JSON_BACKEND = os.environ.get("BARTENDER_JSON") or next(iter(JSON_BACKENDS))
+if JSON_BACKEND not in JSON_BACKENDS:
+    print(f"Warning: JSON backend '{JSON_BACKEND}' not available. Using {next(iter(JSON_BACKENDS))}.")
+    JSON_BACKEND = next(iter(JSON_BACKENDS))
+json_dumps, json_loads = JSON_BACKENDS[JSON_BACKEND]
+
 def dollars_to_words(amount):
     """Convert dollar amount to spoken English"""
     # Handle zero
@@ -108,6 +174,15 @@ def dollars_to_words(amount):
     
     return " ".join(result) if result else "zero dollars"
 
+def ready_time_phrase(seconds):
+    """Spoken estimate of when a drink will be ready"""
+    if seconds < 45:
+        return "It'll be right up."
+    minutes = max(1, round(seconds / 60))
+    if minutes == 1:
+        return "It'll be ready in about a minute."
+    return f"It'll be ready in about {minutes} minutes."
+
 # Drink Menu Database
 DRINKS = {
     "cocktails": {
@@ -146,10 +221,106 @@ DRINKS = {
     }
 }
 
+DOUBLE_SURCHARGE = 3.00
+
+@dataclass(frozen=True)
+class MenuItem:
+    """A drink on the menu. category is the menu section, style the kind of drink."""
+    __slots__ = ("sku", "name", "price", "description", "abv", "style", "category")
+    sku: str
+    name: str
+    price: float
+    description: str
+    abv: float
+    style: str
+    category: str
+    
+    def price_with(self, modifications):
+        """Full menu price with modifications"""
+        if "double" in (modifications or "").lower():
+            return self.price + DOUBLE_SURCHARGE
+        return self.price
+    
+    def to_dict(self):
+        """Menu entry in the DRINKS format"""
+        return {
+            "name": self.name,
+            "price": self.price,
+            "description": self.description,
+            "abv": self.abv,
+            "category": self.style
+        }
+
+# Menu catalog by SKU
+CATALOG = {
+    sku: MenuItem(sku, item["name"], item["price"], item["description"], item["abv"], item["category"], category)
+    for category, items in DRINKS.items()
+    for sku, item in items.items()
+}
+
+@dataclass
+class TabLine:
+    """
+    One line on a tab. Lines travel in global_data on every SWAIG request
+    and response, so on the wire they are a compact [sku, quantity,
+    modifications, unit price in cents] list. Names, descriptions and the
+    rest come from the catalog only when a UI event or spoken response
+    needs them.
+    """
+    __slots__ = ("item", "quantity", "modifications", "unit_cents")
+    item: MenuItem
+    quantity: int
+    modifications: str
+    unit_cents: int
+    
+    @property
+    def sku(self):
+        return self.item.sku
+    
+    @property
+    def total_cents(self):
+        return self.unit_cents * self.quantity
+    
+    @classmethod
+    def from_json(cls, data):
+        """Parse a compact line, or a full dict from calls that predate it"""
+        if isinstance(data, dict):
+            return cls(CATALOG[data["sku"]], data["quantity"], data.get("modifications", ""), round(data["price"] * 100))
+        sku, quantity, modifications, unit_cents = data
+        return cls(CATALOG[sku], quantity, modifications, unit_cents)
+    
+    def to_json(self):
+        return [self.item.sku, self.quantity, self.modifications, self.unit_cents]
+    
+    def to_display_dict(self):
+        """Full line for UI events and the order displays"""
+        item = self.item
+        original_price = item.price_with(self.modifications)
+        return {
+            "sku": item.sku,
+            "name": item.name,
+            "description": item.description,
+            "price": self.unit_cents / 100,
+            "quantity": self.quantity,
+            "total": round(self.total_cents / 100, 2),
+            "modifications": self.modifications,
+            "category": item.category,
+            "abv": item.abv,
+            "original_price": original_price if round(original_price * 100) != self.unit_cents else None
+        }
+
 # Service limits
 MAX_DRINKS_PER_TAB = 20
 MAX_TAB_AMOUNT = 200.00
 
+# Drink prep: matching drinks ordered across tabs within the batch window are
+# made together. Prep time is a base per batch plus a little per extra drink.
+BAR_STATIONS = int(os.environ.get("BAR_STATIONS", 2))
+BATCH_WINDOW_SECONDS = float(os.environ.get("BATCH_WINDOW_SECONDS", 20))
+MAX_BATCH_SIZE = 8
+PREP_SECONDS = {"cocktails": 90, "beer": 20, "wine": 20, "non_alcoholic": 30}
+PREP_SECONDS_PER_EXTRA = {"cocktails": 15, "beer": 10, "wine": 10, "non_alcoholic": 10}
+
 # Drink aliases for better matching
 DRINK_ALIASES = {
     "C001": ["marg", "margarita", "tequila drink"],
@@ -166,13 +337,1398 @@ DRINK_ALIASES = {
     "N006": ["water", "h2o", "aqua", "ice water", "tap water", "bottled water", "still water", "sparkling water"]
 }
 
+# Prompt content, keyed by prompt mode. "full" is the original wording;
+# "compact" drops the redundant bullets and example flows and keeps only what
+# each step needs to drive the functions. Smaller prompts mean a faster time
+# to first token on every turn.
+PROMPT_MODES = ("full", "compact")
+DEFAULT_PROMPT_MODE = os.environ.get("BARTENDER_PROMPT_MODE", "full")
+
+PROMPT_SECTIONS = {
+    "full": [
+        ("Personality",
+         "You are Max, the friendly and professional bartender at Outback Bar. You're warm and welcoming, but always responsible. "
+         "You should be casual and conversational, using phrases a real bartender would use. "
+         "Add personality to your responses - you can be a bit witty and charming, but always professional. "
+         "Remember to be concise and natural in your speech."),
+        ("Function Usage",
+         "IMPORTANT: You don't have a memorized menu. Instead, you have access to functions that handle all drink operations:\n"
+         "- When a customer orders ANY drink, immediately use the add_drink function\n"
+         "- The function will validate if we have it and handle pricing automatically\n"
+         "- If the drink doesn't exist, the function will tell you and you can suggest alternatives\n\n"
+         "CLOSING TABS: This is a quick-service bar, not a long sit-down experience:\n"
+         "- Most customers order 1-3 drinks and close immediately\n"
+         "- Listen for completion signals: 'that's all', 'that's it', 'I'm done', 'nothing else'\n"
+         "- After 2-3 drinks, ask 'Will that be all for you?'\n"
+         "- When they indicate they're done, immediately say something like 'Perfect! Your total is $X. Ready to close out?'\n"
+         "- Don't keep tabs open indefinitely - guide them to close promptly\n\n"
+         "Example flows:\n"
+         "Customer: 'I'll have a margarita and that's it'\n"
+         "You: Use add_drink, then immediately offer to close: 'Great! That's $11.50. Ready to close out?'\n\n"
+         "Customer: 'Two beers please'\n"
+         "You: Add the beers, then ask: 'Anything else, or shall I close your tab?'")
+    ],
+    "compact": [
+        ("Personality",
+         "You are Max, bartender at Outback Bar: warm, a little witty, always responsible. "
+         "Keep replies short and conversational."),
+        ("Function Usage",
+         "You have no memorized menu. Call add_drink for every drink ordered; it validates and prices it. "
+         "If a drink isn't found, suggest an alternative. This is quick service: once they say "
+         "'that's all' or have 2-3 drinks, offer to close the tab.")
+    ]
+}
+
+STEP_BULLETS = {
+    "full": {
+        "greeting": [
+            "Welcome them warmly to Outback Bar",
+            "Ask what they'd like to drink",
+            "Current time: ${global_data.current_time}",
+            "If it's 4-7 PM, mention happy hour discount on cocktails",
+            "When they order ANYTHING, immediately use add_drink function",
+            "Let the function handle validation and pricing"
+        ],
+        "taking_order": [
+            "Current time: ${global_data.current_time}",
+            "Current tab has ${global_data.tab_state.item_count} items",
+            "Current total: $${global_data.tab_state.total}",
+            "ALWAYS use add_drink function when customer orders",
+            "After each drink, assess if they're done:",
+            "  - 1-2 drinks: 'Anything else?'",
+            "  - 3+ drinks: 'Will that be all for you?'",
+            "Listen for completion phrases: 'that's all', 'that's it', 'I'm done'",
+            "When they indicate completion, transition to closing_tab state",
+            "Don't let tabs linger - this is quick service",
+            "If they seem done, say: 'Ready to see your total?' and move to closing_tab"
+        ],
+        "closing_tab": [
+            "IMMEDIATELY use review_tab with closing=true to show tip options",
+            "Do NOT use close_tab until AFTER review_tab shows tip options",
+            "Backend will calculate and present tip suggestions (18%, 20%, 25%)",
+            "Wait for customer to choose a tip amount",
+            "Only after customer selects tip, use close_tab with that percentage",
+            "Keep it brief and efficient"
+        ],
+        "tab_closed": [
+            "Thank them for their business",
+            "Wish them a good day/evening",
+            "Reset for next customer"
+        ]
+    },
+    "compact": {
+        "greeting": [
+            "Welcome them to Outback Bar and ask what they'd like",
+            "Time is ${global_data.current_time}; 4-7 PM is cocktail happy hour",
+            "Call add_drink for every order"
+        ],
+        "taking_order": [
+            "Tab: ${global_data.tab_state.item_count} items, $${global_data.tab_state.total}",
+            "Call add_drink for every order",
+            "After each drink ask 'Anything else?' (3+ drinks: 'Will that be all?')",
+            "When they're done, move to closing_tab"
+        ],
+        "closing_tab": [
+            "First call review_tab with closing=true to present tip options",
+            "Once they pick a tip, call close_tab with that percentage"
+        ],
+        "tab_closed": [
+            "Thank them and wish them a good night"
+        ]
+    }
+}
+
+# Rough token estimate used for prompt size reports
+CHARS_PER_TOKEN = 4
+
+# Scripted conversations for comparing prompt modes. Each turn is one model
+# request: the step the caller is in, plus the tool call the model makes in
+# that turn (if any).
+SCRIPTED_CONVERSATIONS = {
+    "single_drink": [
+        ("greeting", None),
+        ("greeting", ("add_drink", {"drink_name": "margarita"})),
+        ("taking_order", None),
+        ("closing_tab", ("review_tab", {"closing": True})),
+        ("closing_tab", ("close_tab", {"tip_percent": 20})),
+        ("tab_closed", None)
+    ],
+    "round_for_friends": [
+        ("greeting", None),
+        ("greeting", ("add_drink", {"drink_name": "ipa", "quantity": 2})),
+        ("taking_order", ("add_drink", {"drink_name": "mojito"})),
+        ("taking_order", ("add_drink", {"drink_name": "old fashioned", "modifications": "double"})),
+        ("taking_order", ("remove_drink", {"drink_name": "mojito"})),
+        ("taking_order", ("review_tab", {})),
+        ("taking_order", None),
+        ("closing_tab", ("review_tab", {"closing": True})),
+        ("closing_tab", ("close_tab", {"tip_percent": 18})),
+        ("tab_closed", None)
+    ],
+    "happy_hour_question": [
+        ("greeting", ("check_happy_hour", {})),
+        ("greeting", ("add_drink", {"drink_name": "house red"})),
+        ("taking_order", ("add_drink", {"drink_name": "water"})),
+        ("taking_order", None),
+        ("closing_tab", ("review_tab", {"closing": True})),
+        ("closing_tab", ("close_tab", {"tip_percent": 25})),
+        ("tab_closed", None)
+    ]
+}
+
+SNAPSHOT_VERSION = 1
+
+class TfidfIndex:
+    """
+    Word-level TF-IDF index over the drink corpus.
+    
+    Fitting uses scikit-learn. The fitted vocabulary, IDF weights and document
+    vectors can be written to a snapshot and restored with numpy alone, so a
+    fresh process skips the scikit-learn import and the fit.
+    """
+    
+    TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+    
+    def __init__(self, vocabulary, idf, doc_vectors, ngram_range=(1, 2)):
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.doc_vectors = np.asarray(doc_vectors, dtype=np.float64)
+        self.ngram_range = tuple(ngram_range)
+    
+    @classmethod
+    def fit(cls, corpus, ngram_range=(1, 2), max_features=200):
+        """Fit the index on a list of documents"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        
+        vectorizer = TfidfVectorizer(
+            ngram_range=ngram_range,
+            stop_words=None,
+            max_features=max_features,
+            sublinear_tf=True
+        )
+        doc_vectors = vectorizer.fit_transform(corpus).toarray()
+        vocabulary = {term: int(index) for term, index in vectorizer.vocabulary_.items()}
+        return cls(vocabulary, vectorizer.idf_, doc_vectors, ngram_range)
+    
+    def _terms(self, text):
+        """Yield word n-grams the same way TfidfVectorizer's analyzer does"""
+        tokens = self.TOKEN_PATTERN.findall(text.lower())
+        min_n, max_n = self.ngram_range
+        for n in range(min_n, max_n + 1):
+            for i in range(len(tokens) - n + 1):
+                yield " ".join(tokens[i:i + n])
+    
+    def transform(self, texts):
+        """Vectorize texts into L2-normalized, sublinear TF-IDF rows"""
+        vectors = np.zeros((len(texts), len(self.idf)))
+        for row, text in enumerate(texts):
+            for term in self._terms(text):
+                index = self.vocabulary.get(term)
+                if index is not None:
+                    vectors[row, index] += 1
+        
+        counted = vectors > 0
+        vectors[counted] = np.log(vectors[counted]) + 1
+        vectors *= self.idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+    
+    def similarities(self, text):
+        """Cosine similarity between text and every document"""
+        return self.doc_vectors @ self.transform([text])[0]
+    
+    def similarity_matrix(self, texts):
+        """Cosine similarity of each text (rows) against every document (columns)"""
+        return self.transform(texts) @ self.doc_vectors.T
+    
+    def to_dict(self):
+        return {
+            "vocabulary": self.vocabulary,
+            "idf": self.idf.tolist(),
+            "doc_vectors": self.doc_vectors.tolist(),
+            "ngram_range": list(self.ngram_range)
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["vocabulary"], data["idf"], data["doc_vectors"], data["ngram_range"])
+
+def source_fingerprint():
+    """Hash of this file, used to invalidate snapshots built from older code"""
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_snapshot(path, prompt_mode, learned_fingerprint=None):
+    """Load an agent configuration snapshot, or None if missing or stale"""
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not load snapshot {path}: {e}. Building agent from scratch.")
+        return None
+    
+    if (snapshot.get("version") != SNAPSHOT_VERSION
+            or snapshot.get("source_hash") != source_fingerprint()
+            or snapshot.get("prompt_mode") != prompt_mode
+            or snapshot.get("learned_fingerprint") != learned_fingerprint):
+        print(f"Warning: snapshot {path} is stale. Building agent from scratch.")
+        return None
+    
+    return snapshot
+
+# Open tabs with no events for this long (caller hung up without closing)
+# are dropped from the order displays
+OPEN_TAB_IDLE_SECONDS = float(os.environ.get("OPEN_TAB_IDLE_SECONDS", 1800))
+
+class OrderEventBroker:
+    """
+    Fans tab events out from the SWAIG handlers to bar-side order displays.
+    
+    Each event is stamped with a sequence number and encoded once; subscribers
+    share the encoded payload. Every subscriber has a bounded queue, and one
+    that falls too far behind is dropped with an overflow notice so it can
+    reconnect and resume from its last sequence number out of the history
+    buffer. publish() never blocks on a subscriber.
+    
+    A tab with no events for idle_seconds is dropped from open_tabs with a
+    tab_expired event, so calls that end without close_tab don't stay on
+    the displays. Idle tabs are swept on every publish and snapshot, and by
+    the stream keepalive when nothing is being published.
+    """
+    
+    def __init__(self, history_size=2000, queue_size=256, idle_seconds=OPEN_TAB_IDLE_SECONDS):
+        self.queue_size = queue_size
+        self.idle_seconds = idle_seconds
+        self._history = collections.deque(maxlen=history_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._seq = 0
+        self.open_tabs = {}
+        self.stats = {"published": 0, "subscribers": 0, "dropped": 0, "expired": 0}
+    
+    def _expire_idle_tabs(self):
+        """Drop idle tabs (oldest update first) and announce each one; caller holds the lock"""
+        cutoff = time.monotonic() - self.idle_seconds
+        expired = 0
+        while self.open_tabs:
+            call_id, tab = next(iter(self.open_tabs.items()))
+            if tab["active_at"] > cutoff:
+                break
+            del self.open_tabs[call_id]
+            self._seq += 1
+            record = {
+                "seq": self._seq,
+                "call_id": call_id,
+                "time": datetime.now().isoformat(),
+                "event": {"type": "tab_expired"}
+            }
+            encoded = (self._seq, "tab_expired", json_dumps(record).decode())
+            self._history.append(encoded)
+            for subscriber in self._subscribers:
+                subscriber.offer(encoded)
+            self.stats["expired"] += 1
+            expired += 1
+        return expired
+    
+    def expire_idle_tabs(self):
+        """
+        Sweep idle tabs when nothing is being published. Called from the
+        event loop (the stream keepalive), so subscribers are woken directly.
+        """
+        with self._lock:
+            expired = self._expire_idle_tabs()
+        if expired:
+            self._wake_subscribers()
+    
+    def publish(self, call_id, event, tab_state=None):
+        """Record an event and queue it for every subscriber"""
+        with self._lock:
+            self._expire_idle_tabs()
+            self._seq += 1
+            record = {
+                "seq": self._seq,
+                "call_id": call_id,
+                "time": datetime.now().isoformat(),
+                "event": event
+            }
+            if tab_state is not None:
+                record["items"] = [line.to_display_dict() for line in tab_state["items"]]
+                record["total"] = tab_state["total"]
+            encoded = (self._seq, event["type"], json_dumps(record).decode())
+            self._history.append(encoded)
+            
+            if tab_state is not None and event["type"] == "tab_closed":
+                self.open_tabs.pop(call_id, None)
+            elif tab_state is not None:
+                # Re-inserted so the dict stays ordered by last update
+                self.open_tabs.pop(call_id, None)
+                self.open_tabs[call_id] = {
+                    "call_id": call_id,
+                    "items": list(tab_state["items"]),
+                    "total": tab_state["total"],
+                    "item_count": tab_state["item_count"],
+                    "seq": self._seq,
+                    "updated": record["time"],
+                    "active_at": time.monotonic()
+                }
+            self.stats["published"] += 1
+            
+            for subscriber in self._subscribers:
+                subscriber.offer(encoded)
+            loop = self._loop
+        
+        if loop is not None and self._subscribers:
+            try:
+                loop.call_soon_threadsafe(self._wake_subscribers)
+            except RuntimeError:
+                pass
+    
+    def _wake_subscribers(self):
+        for subscriber in list(self._subscribers):
+            subscriber.ready.set()
+    
+    def subscribe(self, since=None):
+        """
+        Register a new subscriber. If since is given, events after that
+        sequence number are replayed from history; a subscriber that asks
+        for events older than the history is told to reset instead.
+        """
+        subscriber = _EventSubscriber(self.queue_size)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            if since is not None:
+                oldest = self._history[0][0] if self._history else self._seq + 1
+                if since > self._seq or since < oldest - 1:
+                    subscriber.reset = True
+                else:
+                    subscriber.queue.extend(encoded for encoded in self._history if encoded[0] > since)
+            self._subscribers.add(subscriber)
+            self.stats["subscribers"] = len(self._subscribers)
+        subscriber.ready.set()
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            self.stats["subscribers"] = len(self._subscribers)
+            if subscriber.overflowed:
+                self.stats["dropped"] += 1
+    
+    def snapshot(self):
+        """Open tabs plus the sequence number they are current as of"""
+        with self._lock:
+            self._expire_idle_tabs()
+            tabs = []
+            for tab in self.open_tabs.values():
+                tab = dict(tab, items=[line.to_display_dict() for line in tab["items"]])
+                del tab["active_at"]
+                tabs.append(tab)
+            return {"seq": self._seq, "tabs": tabs}
+
+class _EventSubscriber:
+    """Bounded per-subscriber queue of encoded events"""
+    
+    def __init__(self, queue_size):
+        self.queue = collections.deque()
+        self.queue_size = queue_size
+        self.ready = asyncio.Event()
+        self.overflowed = False
+        self.reset = False
+    
+    def offer(self, encoded):
+        if self.overflowed:
+            return
+        if len(self.queue) >= self.queue_size:
+            self.overflowed = True
+            self.queue.clear()
+            return
+        self.queue.append(encoded)
+
+class PrepQueue:
+    """
+    Groups matching drinks (same SKU and modifications) from every open tab
+    into prep batches and schedules the batches onto bartender stations.
+    
+    A batch takes new lines until its window closes or it is full; it is
+    then assigned to the station that frees up first. Adding a line
+    re-projects the ready time of every open batch, O(k log s) for k open
+    batches and s stations (they open in close order, so the sort is
+    linear); removing one is a lookup by batch key.
+    """
+    
+    def __init__(self, stations=BAR_STATIONS, window=BATCH_WINDOW_SECONDS, max_batch=MAX_BATCH_SIZE):
+        self.window = window
+        self.max_batch = max_batch
+        self._stations = [(0.0, station) for station in range(1, stations + 1)]
+        self._open = {}
+        self._closing = []
+        self._pending = {}
+        self._done = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+    
+    def _duration(self, batch):
+        category = batch["category"]
+        return PREP_SECONDS.get(category, 60) + PREP_SECONDS_PER_EXTRA.get(category, 10) * (batch["count"] - 1)
+    
+    def _batch_key(self, sku, modifications):
+        return sku, (modifications or "").strip().lower()
+    
+    def _estimate(self):
+        """
+        Project ready times for the open batches by replaying them, in the
+        order their windows close, onto a copy of the stations, the same
+        way _assign will schedule them
+        """
+        stations = list(self._stations)
+        for batch in sorted(self._open.values(), key=lambda batch: (batch["close_at"], batch["id"])):
+            if batch["count"] <= 0:
+                continue
+            free_at, station = heapq.heappop(stations)
+            batch["ready_at"] = max(free_at, batch["close_at"]) + self._duration(batch)
+            heapq.heappush(stations, (batch["ready_at"], station))
+    
+    def _assign(self, batch, now):
+        """Close a batch and hand it to the first free station"""
+        del self._open[batch["key"]]
+        if batch["count"] <= 0:
+            self._pending.pop(batch["id"], None)
+            return
+        free_at, station = heapq.heappop(self._stations)
+        start = max(free_at, min(batch["close_at"], now))
+        batch["station"] = station
+        batch["ready_at"] = start + self._duration(batch)
+        heapq.heappush(self._stations, (batch["ready_at"], station))
+        heapq.heappush(self._done, (batch["ready_at"], batch["id"]))
+    
+    def _advance(self, now):
+        """Assign batches whose window has closed and drop finished ones"""
+        while self._closing and self._closing[0][0] <= now:
+            close_at, batch_id = heapq.heappop(self._closing)
+            batch = self._pending.get(batch_id)
+            if batch and batch["station"] is None:
+                self._assign(batch, now)
+        while self._done and self._done[0][0] <= now:
+            ready_at, batch_id = heapq.heappop(self._done)
+            self._pending.pop(batch_id, None)
+    
+    def add(self, call_id, sku, name, category, modifications, quantity, now=None):
+        """Queue drinks for a tab and return the batch they joined"""
+        now = now or time.time()
+        key = self._batch_key(sku, modifications)
+        
+        with self._lock:
+            self._advance(now)
+            
+            batch = self._open.get(key)
+            if batch and batch["count"] + quantity > self.max_batch:
+                self._assign(batch, now)
+                batch = None
+            
+            if batch is None:
+                batch = {
+                    "id": next(self._ids),
+                    "key": key,
+                    "sku": sku,
+                    "name": name,
+                    "category": category,
+                    "modifications": modifications,
+                    "lines": [],
+                    "count": 0,
+                    "close_at": now + self.window,
+                    "station": None,
+                    "ready_at": None
+                }
+                self._open[key] = batch
+                self._pending[batch["id"]] = batch
+                heapq.heappush(self._closing, (batch["close_at"], batch["id"]))
+            
+            batch["lines"].append([call_id, quantity])
+            batch["count"] += quantity
+            self._estimate()
+            return self._describe(batch, now)
+    
+    def remove(self, call_id, sku, modifications, quantity):
+        """Take drinks removed from a tab back out of batches not yet started"""
+        key = self._batch_key(sku, modifications)
+        with self._lock:
+            batch = self._open.get(key)
+            if batch is None:
+                return
+            for line in batch["lines"]:
+                if line[0] == call_id and quantity > 0:
+                    taken = min(line[1], quantity)
+                    line[1] -= taken
+                    batch["count"] -= taken
+                    quantity -= taken
+            batch["lines"] = [line for line in batch["lines"] if line[1] > 0]
+    
+    def _describe(self, batch, now):
+        return {
+            "batch_id": batch["id"],
+            "sku": batch["sku"],
+            "name": batch["name"],
+            "modifications": batch["modifications"],
+            "count": batch["count"],
+            "tabs": len({line[0] for line in batch["lines"]}),
+            "station": batch["station"],
+            "ready_at": datetime.fromtimestamp(batch["ready_at"]).isoformat(timespec="seconds"),
+            "ready_in": max(0, round(batch["ready_at"] - now))
+        }
+    
+    def snapshot(self, now=None):
+        """Every batch that is open or still being made, soonest first"""
+        now = now or time.time()
+        with self._lock:
+            self._advance(now)
+            self._estimate()
+            batches = [batch for batch in self._pending.values() if batch["count"] > 0]
+            batches.sort(key=lambda batch: batch["ready_at"])
+            return [self._describe(batch, now) for batch in batches]
+
+# Duplicate SWAIG webhook handling
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 120))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", 10000))
+
+def swaig_request_hash(name, args, global_data):
+    """
+    Hash of a SWAIG function call. A retried webhook carries the same
+    arguments and global_data as the original; a real repeat order carries
+    the tab as updated since, and every tab update bumps its revision, so
+    it hashes differently.
+    """
+    payload = json_dumps([name, args, global_data], sort_keys=True)
+    return hashlib.sha256(payload).hexdigest()
+
+class IdempotencyCache:
+    """
+    Remembers SWAIG function results by call ID and request hash.
+    
+    A duplicate of a finished call gets the cached result without running
+    the handler again. The SDK runs SWAIG functions synchronously on the
+    event loop, so a duplicate can't arrive while the original is running.
+    Entries expire after the TTL and the oldest are evicted past
+    max_entries. Only successful SwaigFunctionResults are cached, so a
+    failed call can be retried.
+    """
+    
+    def __init__(self, ttl=IDEMPOTENCY_TTL_SECONDS, max_entries=IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+    
+    def _expire(self, now):
+        while self._entries:
+            key, (expires_at, result) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[key]
+            self._counters["expired"] += 1
+    
+    def run(self, key, execute):
+        """Return the result for key, running execute() only for the first request"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._counters["hits"] += 1
+                return entry[1]
+            self._counters["misses"] += 1
+        
+        result = execute()
+        
+        with self._lock:
+            if isinstance(result, SwaigFunctionResult):
+                self._entries[key] = (time.monotonic() + self.ttl, result)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._counters["evicted"] += 1
+        return result
+    
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+# Admission control. Requests are grouped into route classes; tool calls for
+# callers already mid-order go first, then new calls, then the web/API routes.
+# Each class has its own concurrency and queue caps under a shared total, and
+# the shared total leaves room for tool calls even when new calls surge.
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", 16))
+ADMISSION_LIMITS = {
+    # route class: (priority, max concurrent, max queued)
+    "swaig": (0, int(os.environ.get("SWAIG_CONCURRENCY", 16)), int(os.environ.get("SWAIG_QUEUE_DEPTH", 200))),
+    "swml": (1, int(os.environ.get("SWML_CONCURRENCY", 8)), int(os.environ.get("SWML_QUEUE_DEPTH", 20))),
+    "api": (2, int(os.environ.get("API_CONCURRENCY", 4)), int(os.environ.get("API_QUEUE_DEPTH", 20))),
+}
+# Above this event loop lag, new calls and API requests are shed (tool calls never are)
+ADMISSION_MAX_LOOP_LAG = float(os.environ.get("ADMISSION_MAX_LOOP_LAG", 0.25))
+# A queued request that hasn't started within this many seconds is shed
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 5.0))
+
+# Readiness (/ready) thresholds. Lag is stricter than the shedding threshold,
+# so an instance reports not-ready before it starts turning callers away.
+READY_MAX_LOOP_LAG = float(os.environ.get("READY_MAX_LOOP_LAG", 0.1))
+READY_MAX_QUEUED = int(os.environ.get("READY_MAX_QUEUED", 10))
+READY_MIN_MEMORY_HEADROOM = float(os.environ.get("READY_MIN_MEMORY_HEADROOM", 0.10))
+
+def memory_limit_bytes():
+    """
+    Memory limit for this process: READY_MEMORY_LIMIT_MB, else the cgroup
+    limit, else None (headroom is then taken from available system memory)
+    """
+    if os.environ.get("READY_MEMORY_LIMIT_MB"):
+        return int(float(os.environ["READY_MEMORY_LIMIT_MB"]) * 1024 * 1024)
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # Unlimited cgroups report "max" or a huge page-aligned number
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+        return None
+    return None
+
+def memory_usage():
+    """Current RSS in bytes and available memory in bytes (None where unknown)"""
+    rss = available = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        pass
+    return rss, available
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag: how late a periodic sleep wakes up. current()
+    is the latest sample, a decaying recent peak if that is higher, or how
+    overdue the pending wake-up already is, so a request that runs while
+    the loop is backed up sees the lag before the next sample lands.
+    """
+    
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.lag = 0.0
+        self._due = None
+        self._task = None
+    
+    def start(self):
+        """Start sampling on the running loop (no-op once started)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            sample = max(0.0, loop.time() - self._due)
+            self.lag = max(sample, self.lag * 0.8)
+    
+    def current(self):
+        """Event loop lag in seconds"""
+        if self._due is None:
+            return self.lag
+        return max(self.lag, asyncio.get_running_loop().time() - self._due)
+
+class Overloaded(Exception):
+    """Raised when a request is shed; carries the suggested Retry-After in seconds"""
+    
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Priority-aware concurrency limiter for the web app.
+    
+    acquire() admits a request straight away when its class and the shared
+    total have room, otherwise queues it. A freed slot goes to the queued
+    request with the best priority whose class is under its cap, FIFO within
+    a class. Requests are shed with Overloaded when their class queue is
+    full, when they wait longer than queue_timeout, or (for classes other
+    than swaig) when the event loop lag is over max_loop_lag.
+    """
+    
+    def __init__(self, limits=ADMISSION_LIMITS, max_concurrent=ADMISSION_MAX_CONCURRENT,
+                 max_loop_lag=ADMISSION_MAX_LOOP_LAG, queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+                 lag_monitor=None):
+        self.limits = limits
+        self.max_concurrent = max_concurrent
+        self.max_loop_lag = max_loop_lag
+        self.queue_timeout = queue_timeout
+        self.lag_monitor = lag_monitor or LoopLagMonitor()
+        
+        self.running = {route_class: 0 for route_class in limits}
+        self.waiting = {route_class: 0 for route_class in limits}
+        self.counters = {route_class: collections.Counter() for route_class in limits}
+        # Smoothed request duration per class, for Retry-After estimates
+        self.service_seconds = {route_class: 0.05 for route_class in limits}
+        self._total_running = 0
+        self._waiters = []  # heap of (priority, seq, route_class, future)
+        self._seq = itertools.count()
+    
+    def _start(self, route_class):
+        self.running[route_class] += 1
+        self._total_running += 1
+        self.counters[route_class]["admitted"] += 1
+        return route_class, time.perf_counter()
+    
+    def _retry_after(self, route_class):
+        """Seconds until the queue ahead of a new request should have drained"""
+        priority = self.limits[route_class][0]
+        ahead = sum(self.waiting[c] for c, limits in self.limits.items() if limits[0] <= priority)
+        concurrency = min(self.limits[route_class][1], self.max_concurrent)
+        return max(1, int(-(-(ahead + 1) * self.service_seconds[route_class] // concurrency)))
+    
+    def _shed(self, route_class, reason):
+        self.counters[route_class][f"shed_{reason}"] += 1
+        return Overloaded(reason, self._retry_after(route_class))
+    
+    async def acquire(self, route_class):
+        """Wait for a slot; returns a token for release() or raises Overloaded"""
+        self.lag_monitor.start()
+        priority, max_running, max_queued = self.limits[route_class]
+        
+        if route_class != "swaig" and self.lag_monitor.current() > self.max_loop_lag:
+            raise self._shed(route_class, "loop_lag")
+        
+        if (self._total_running < self.max_concurrent and self.running[route_class] < max_running
+                and not self.waiting[route_class]):
+            return self._start(route_class)
+        
+        if self.waiting[route_class] >= max_queued:
+            raise self._shed(route_class, "queue_full")
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), route_class, future))
+        self.waiting[route_class] += 1
+        self.counters[route_class]["queued"] += 1
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # Client went away while queued: give back a slot that was
+            # already handed over, or make _dispatch skip this waiter
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            else:
+                future.cancel()
+            raise
+        finally:
+            self.waiting[route_class] -= 1
+        
+        if not future.done():
+            future.cancel()
+            raise self._shed(route_class, "queue_timeout")
+        return future.result()
+    
+    def release(self, token):
+        route_class, started = token
+        self.running[route_class] -= 1
+        self._total_running -= 1
+        elapsed = time.perf_counter() - started
+        self.service_seconds[route_class] += 0.2 * (elapsed - self.service_seconds[route_class])
+        self._dispatch()
+    
+    def _dispatch(self):
+        """Hand free slots to the best queued requests whose class has room"""
+        blocked = []
+        while self._waiters and self._total_running < self.max_concurrent:
+            entry = heapq.heappop(self._waiters)
+            route_class, future = entry[2], entry[3]
+            if future.done():
+                continue
+            if self.running[route_class] >= self.limits[route_class][1]:
+                blocked.append(entry)
+                continue
+            future.set_result(self._start(route_class))
+        for entry in blocked:
+            heapq.heappush(self._waiters, entry)
+    
+    def stats(self):
+        return {
+            "loop_lag_ms": round(self.lag_monitor.current() * 1000, 1),
+            "running": self._total_running,
+            "max_concurrent": self.max_concurrent,
+            "classes": {
+                route_class: dict(self.counters[route_class],
+                                  running=self.running[route_class],
+                                  waiting=self.waiting[route_class])
+                for route_class in self.limits
+            }
+        }
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that runs requests through an AdmissionController.
+    Shed requests get an immediate 503 with Retry-After. Paths that
+    classify() maps to None (static files, health checks, stats, the
+    order stream) are not limited.
+    """
+    
+    def __init__(self, app, controller, classify):
+        self.app = app
+        self.controller = controller
+        self.classify = classify
+    
+    async def __call__(self, scope, receive, send):
+        route_class = self.classify(scope["path"]) if scope["type"] == "http" else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+        
+        try:
+            token = await self.controller.acquire(route_class)
+        except Overloaded as e:
+            body = json_dumps({"error": "overloaded", "reason": e.reason})
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(e.retry_after).encode()),
+                ]
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(token)
+
+# Per-call tracing. Every request of a call shares a trace ID derived from
+# the call ID; finished requests are kept in a ring buffer for /debug/calls
+# and optionally exported as OTLP JSON.
+TRACE_MAX_CALLS = int(os.environ.get("TRACE_MAX_CALLS", 200))
+TRACE_MAX_REQUESTS_PER_CALL = 100
+# File path for OTLP JSON lines, or a collector URL (http://host:4318)
+TRACE_EXPORT = os.environ.get("TRACE_EXPORT")
+
+_current_span = contextvars.ContextVar("bartender_current_span", default=None)
+_current_request = contextvars.ContextVar("bartender_current_request", default=None)
+_NO_SPAN = nullcontext()
+
+class Span:
+    """One timed phase of a request"""
+    
+    __slots__ = ("name", "call_id", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "finished")
+    
+    def __init__(self, name, call_id, trace_id, parent_id, finished, attributes):
+        self.name = name
+        self.call_id = call_id
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        # Shared by every span of the request, in the order they finish
+        self.finished = finished
+    
+    def set(self, key, value):
+        self.attributes[key] = value
+
+def otlp_json(spans, service_name="bartender-agent"):
+    """Encode spans as an OTLP/JSON ExportTraceServiceRequest"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "bartender_agent"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 2 if span.parent_id is None else 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [
+                        {"key": key, "value": {"stringValue": str(value)}}
+                        for key, value in dict(span.attributes, **{"call.id": span.call_id}).items()
+                    ]
+                } for span in spans]
+            }]
+        }]
+    }
+
+class SpanExporter:
+    """
+    Exports finished requests from a background thread, so the request never
+    waits on disk or the network. target is a file path (one OTLP JSON
+    document per line) or a collector URL (posted to /v1/traces).
+    """
+    
+    MAX_QUEUED = 1000
+    
+    def __init__(self, target):
+        self.target = target
+        self.is_url = target.startswith(("http://", "https://"))
+        if self.is_url and not target.rstrip("/").endswith("/v1/traces"):
+            self.target = target.rstrip("/") + "/v1/traces"
+        self.dropped = 0
+        self._queue = queue.Queue(self.MAX_QUEUED)
+        threading.Thread(target=self._run, name="trace-export", daemon=True).start()
+    
+    def export(self, spans):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+    
+    def _run(self):
+        import urllib.request
+        
+        while True:
+            payload = json_dumps(otlp_json(self._queue.get()))
+            try:
+                if self.is_url:
+                    request = urllib.request.Request(self.target, data=payload,
+                                                     headers={"Content-Type": "application/json"})
+                    urllib.request.urlopen(request, timeout=5).close()
+                else:
+                    with open(self.target, "ab") as f:
+                        f.write(payload + b"\n")
+            except Exception as e:
+                self.dropped += 1
+                print(f"Warning: trace export to {self.target} failed: {e}")
+
+class CallTracer:
+    """
+    Lightweight tracing tagged by call ID.
+    
+    request() opens the root span of one HTTP request and span() opens a
+    child of whatever span is current, tracked in a context variable so
+    phases deep in the SWAIG handlers need no tracer plumbing. Outside a
+    request, span() does nothing. The call ID is attached with bind() once
+    the SDK has authenticated the request and parsed its body; a request
+    that never gets one (rejected, malformed) is discarded. Otherwise, when
+    the root span ends its spans are added to the call's timeline in the
+    ring buffer and handed to the exporter.
+    """
+    
+    def __init__(self, max_calls=TRACE_MAX_CALLS, export=TRACE_EXPORT):
+        self.max_calls = max_calls
+        self.exporter = SpanExporter(export) if export else None
+        self._calls = collections.OrderedDict()  # call_id -> deque of requests (span lists)
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def request(self, name, **attributes):
+        if not self.max_calls:
+            yield None
+            return
+        
+        span = Span(name, None, None, None, [], attributes)
+        token = _current_span.set(span)
+        request_token = _current_request.set(span)
+        try:
+            yield span
+        finally:
+            _current_request.reset(request_token)
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            span.finished.append(span)
+            if span.call_id is not None:
+                for child in span.finished:
+                    child.call_id = span.call_id
+                    child.trace_id = span.trace_id
+                self._record(span.call_id, span.finished)
+    
+    def bind(self, call_id, **attributes):
+        """Tag the current request with its call ID so it is recorded"""
+        root = _current_request.get()
+        if root is None or not isinstance(call_id, str) or not call_id:
+            return
+        root.call_id = call_id
+        root.trace_id = hashlib.sha256(call_id.encode()).hexdigest()[:32]
+        root.attributes.update(attributes)
+    
+    def span(self, name, **attributes):
+        parent = _current_span.get()
+        if parent is None:
+            return _NO_SPAN
+        return self._child_span(name, parent, attributes)
+    
+    @contextmanager
+    def _child_span(self, name, parent, attributes):
+        span = Span(name, parent.call_id, parent.trace_id, parent.span_id, parent.finished, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            span.finished.append(span)
+    
+    def _record(self, call_id, spans):
+        with self._lock:
+            requests = self._calls.pop(call_id, None)
+            if requests is None:
+                requests = collections.deque(maxlen=TRACE_MAX_REQUESTS_PER_CALL)
+            requests.append(spans)
+            self._calls[call_id] = requests
+            while len(self._calls) > self.max_calls:
+                self._calls.popitem(last=False)
+        if self.exporter:
+            self.exporter.export(spans)
+    
+    def recent_calls(self):
+        """Call IDs in the ring buffer, most recent first"""
+        with self._lock:
+            return list(reversed(self._calls))
+    
+    def timeline(self, call_id):
+        """Per-request span timeline for a call, or None if it isn't in the buffer"""
+        with self._lock:
+            requests = list(self._calls.get(call_id, ()))
+        if not requests:
+            return None
+        
+        call_start = requests[0][-1].start_ns
+        phases = collections.Counter()
+        timeline = []
+        for spans in requests:
+            root = spans[-1]
+            depths = {root.span_id: 0}
+            entries = []
+            for span in sorted(spans, key=lambda span: span.start_ns):
+                depths[span.span_id] = depths.get(span.parent_id, -1) + 1
+                duration_ms = (span.end_ns - span.start_ns) / 1e6
+                if span is not root:
+                    phases[span.name] += duration_ms
+                entries.append({
+                    "name": span.name,
+                    "depth": depths[span.span_id],
+                    "offset_ms": round((span.start_ns - root.start_ns) / 1e6, 3),
+                    "duration_ms": round(duration_ms, 3),
+                    "attributes": span.attributes
+                })
+            timeline.append({
+                "name": root.name,
+                "offset_ms": round((root.start_ns - call_start) / 1e6, 3),
+                "duration_ms": round((root.end_ns - root.start_ns) / 1e6, 3),
+                "spans": entries
+            })
+        
+        return {
+            "call_id": call_id,
+            "trace_id": requests[0][-1].trace_id,
+            "requests": timeline,
+            "phase_totals_ms": {name: round(total, 3) for name, total in phases.most_common()}
+        }
+
+# Drink lookup tiers, cheapest first
+DRINK_MATCH_TIERS = ("exact", "alias", "phonetic", "fuzzy")
+FUZZY_MATCH_THRESHOLD = 0.35
+
+# Spelling rewrites applied before phonetic coding, so common speech
+# recognition misspellings collapse onto the menu spelling
+PHONETIC_REWRITES = [
+    (re.compile(r"[^a-z]"), ""),
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"ck"), "k"),
+    (re.compile(r"qu"), "k"),
+    (re.compile(r"x"), "ks"),
+    (re.compile(r"(?<=[aeiou])j(?=[aeiou])"), "h"),
+    (re.compile(r"et$"), "ay"),
+    (re.compile(r"^kn"), "n"),
+    (re.compile(r"^wr"), "r")
+]
+PHONETIC_CODES = {
+    letter: code
+    for letters, code in [("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6")]
+    for letter in letters
+}
+
+def phonetic_key(text):
+    """
+    Soundex-style key over the whole phrase with spaces removed, so "march a
+    rita" and "margarita" share a key. Unlike Soundex the consonant code is
+    not truncated, and the number of vowel groups is appended to keep
+    different syllable counts apart ("mojito" vs "mai tai").
+    """
+    word = text.lower()
+    for pattern, replacement in PHONETIC_REWRITES:
+        word = pattern.sub(replacement, word)
+    if not word:
+        return ""
+    
+    codes = [] if word[0] in "aeiouy" else [PHONETIC_CODES.get(word[0], "")]
+    vowel_groups = 0
+    last_code = PHONETIC_CODES.get(word[0], "")
+    in_vowels = False
+    for i, letter in enumerate(word):
+        is_vowel = letter in "aeiou" or (letter == "y" and i > 0)
+        if is_vowel and not in_vowels:
+            vowel_groups += 1
+        in_vowels = is_vowel
+        if i == 0:
+            continue
+        code = PHONETIC_CODES.get(letter, "")
+        if code and code != last_code:
+            codes.append(code)
+        if letter not in "hw":
+            last_code = code
+    
+    consonants = "".join(codes)
+    if len(consonants) < 2:
+        return ""
+    return f"{consonants}:{vowel_groups}"
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings"""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+# Speech hints. SERVICE_HINTS are always sent; DRINK_HINTS are the hand-written
+# drink terms, used as they are until hints are regenerated from sales.
+DRINK_HINTS = [
+    "margarita", "old fashioned", "mojito", "martini", "cosmopolitan",
+    "manhattan", "negroni", "moscow mule", "whiskey sour", "mai tai",
+    "beer", "ipa", "lager", "stout", "pale ale", "wheat beer",
+    "wine", "red", "white", "prosecco", "pinot noir", "sauvignon blanc",
+    "vodka", "gin", "rum", "whiskey", "tequila", "bourbon",
+    "water", "soda", "juice", "virgin", "mocktail"
+]
+SERVICE_HINTS = [
+    "double", "rocks", "neat", "tall", "dirty", "dry",
+    "tab", "check", "close out", "pay", "tip",
+    "that's all", "that's it", "I'm done", "nothing else", "I'm good"
+]
+HINT_BUDGET = int(os.environ.get("HINT_BUDGET", 60))
+
+# Resolution log and the aliases and hints learned from it
+RESOLUTION_LOG = os.environ.get("RESOLUTION_LOG")
+LEARNED_ALIASES = os.environ.get("LEARNED_ALIASES")
+# A learned alias needs this many supporting resolutions, with at least
+# this share of the query's evidence pointing at the same drink
+LEARN_MIN_COUNT = 3
+LEARN_MIN_AGREEMENT = 0.8
+# A missed query only counts as a correction to the drink ordered next if it
+# was close to it: a consonant code within this share of edits of the drink's
+# (and at most one vowel group apart), or the drink being the fuzzy matcher's
+# top candidate with a score of at least NEAR_MISS_THRESHOLD
+NEAR_MISS_PHONETIC_DISTANCE = 0.25
+NEAR_MISS_THRESHOLD = 0.3
+
+class ResolutionLog:
+    """
+    Appends one JSON line per drink resolution, sale and removal, for
+    learn_aliases. Events without a call ID are not logged.
+    
+    It also spots follow-up corrections within a call: a miss, or an alias,
+    phonetic or fuzzy match the caller then removed, followed by a
+    successful order in the same call. That is only logged as a correction
+    of the original query when near_miss(query, sku) says the query was
+    close to the drink ordered; otherwise the caller most likely settled
+    for something else. A removed match followed by an unrelated order is
+    logged as a rejection of the match.
+    """
+    
+    MAX_PENDING_CALLS = 10000
+    
+    def __init__(self, path, near_miss):
+        self.path = path
+        self.near_miss = near_miss
+        self._file = open(path, "ab") if path else None
+        self._pending = collections.OrderedDict()  # call_id -> {"query", "sku", "rejected"}
+        self._lock = threading.Lock()
+    
+    def _write(self, record):
+        self._file.write(json_dumps(record) + b"\n")
+        self._file.flush()
+    
+    def resolved(self, call_id, query, tier, sku):
+        if self._file is None or not call_id:
+            return
+        query = query.lower().strip()
+        with self._lock:
+            self._write({"time": time.time(), "call_id": call_id, "event": "resolve",
+                         "query": query, "tier": tier, "sku": sku})
+            
+            pending = self._pending.pop(call_id, None)
+            if sku and pending and (pending["sku"] is None or pending["rejected"]) and sku != pending["sku"]:
+                evidence = self.near_miss(pending["query"], sku)
+                if evidence:
+                    self._write({"time": time.time(), "call_id": call_id, "event": "correction",
+                                 "query": pending["query"], "sku": sku, "original_sku": pending["sku"],
+                                 "evidence": evidence})
+                elif pending["sku"]:
+                    self._write({"time": time.time(), "call_id": call_id, "event": "rejection",
+                                 "query": pending["query"], "sku": pending["sku"]})
+            elif tier != "exact":
+                self._pending[call_id] = {"query": query, "sku": sku, "rejected": False}
+                while len(self._pending) > self.MAX_PENDING_CALLS:
+                    self._pending.popitem(last=False)
+    
+    def sold(self, call_id, sku, quantity):
+        if self._file is None or not call_id:
+            return
+        with self._lock:
+            self._write({"time": time.time(), "call_id": call_id, "event": "sale", "sku": sku, "quantity": quantity})
+    
+    def removed(self, call_id, sku, quantity):
+        if self._file is None or not call_id:
+            return
+        with self._lock:
+            self._write({"time": time.time(), "call_id": call_id, "event": "removal", "sku": sku, "quantity": quantity})
+            pending = self._pending.get(call_id)
+            if pending and pending["sku"] == sku:
+                pending["rejected"] = True
+    
+    def end_call(self, call_id):
+        with self._lock:
+            self._pending.pop(call_id, None)
+
+def load_learned_aliases(path):
+    """Load a learn_aliases output file; returns (learned, fingerprint) or (None, None)"""
+    if not path:
+        return None, None
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        return json_loads(data), hashlib.sha256(data).hexdigest()
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not load learned aliases {path}: {e}. Using the built-in aliases and hints.")
+        return None, None
+
+def build_speech_hints(sales, aliases, budget=HINT_BUDGET):
+    """
+    Speech hints within a budget: the service phrases, then the best-selling
+    drinks' menu names, then their aliases, then the remaining hand-written
+    drink terms. sales maps SKU to units sold; aliases maps SKU to alias
+    lists, most used first.
+    """
+    by_sales = sorted(CATALOG, key=lambda sku: -sales.get(sku, 0))
+    candidates = list(SERVICE_HINTS)
+    candidates += [CATALOG[sku].name.lower() for sku in by_sales]
+    candidates += [alias for sku in by_sales if sales.get(sku, 0) > 0 for alias in aliases.get(sku, [])]
+    candidates += DRINK_HINTS
+    
+    hints = []
+    seen = set()
+    for hint in candidates:
+        if hint.lower() not in seen:
+            seen.add(hint.lower())
+            hints.append(hint)
+    return hints[:budget]
+
+def learn_aliases(log_paths, previous=None, min_count=LEARN_MIN_COUNT, hint_budget=HINT_BUDGET):
+    """
+    Offline job over resolution logs. Promotes queries that keep resolving
+    through the fuzzy tier, or keep getting corrected to the same drink,
+    into exact-lookup aliases; regenerates speech hints weighted by sales;
+    and reports fuzzy and miss rates per week. Aliases learned in an
+    earlier run (previous) are kept unless corrections now point elsewhere.
+    Returns the data to write to the LEARNED_ALIASES file.
+    """
+    agent = BartenderAgent(learned_aliases_path="")
+    evidence = collections.defaultdict(collections.Counter)  # query -> sku -> supporting count
+    sales = collections.Counter()
+    weeks = collections.defaultdict(collections.Counter)
+    records = 0
+    
+    for path in log_paths:
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json_loads(line)
+                records += 1
+                event = record["event"]
+                if event == "resolve":
+                    week = datetime.fromtimestamp(record["time"]).strftime("%G-W%V")
+                    weeks[week]["resolved"] += 1
+                    weeks[week][record["tier"] or "miss"] += 1
+                    if record["tier"] == "fuzzy":
+                        evidence[record["query"]][record["sku"]] += 1
+                elif event == "correction" and record.get("evidence"):
+                    evidence[record["query"]][record["sku"]] += 1
+                    if record["original_sku"]:
+                        # The fuzzy or phonetic guess was wrong
+                        evidence[record["query"]][record["original_sku"]] -= 1
+                elif event == "rejection":
+                    evidence[record["query"]][record["sku"]] -= 1
+                elif event == "sale":
+                    sales[record["sku"]] += record["quantity"]
+                elif event == "removal":
+                    sales[record["sku"]] -= record["quantity"]
+    
+    learned = {}
+    for sku, queries in (previous or {}).get("aliases", {}).items():
+        for query in queries:
+            learned[query] = sku
+    for query, counts in sorted(evidence.items(), key=lambda entry: -sum(entry[1].values())):
+        if query in agent.name_index or query in agent.alias_index:
+            continue
+        sku, support = counts.most_common(1)[0]
+        total = sum(count for count in counts.values() if count > 0)
+        if support >= min_count and support >= LEARN_MIN_AGREEMENT * total and sku in CATALOG:
+            learned[query] = sku
+        elif learned.get(query) and counts[learned[query]] < 0:
+            # Callers keep correcting this learned alias
+            del learned[query]
+    
+    aliases = collections.defaultdict(list)
+    for query, sku in learned.items():
+        aliases[sku].append(query)
+    
+    known_aliases = {sku: list(DRINK_ALIASES.get(sku, [])) + aliases.get(sku, []) for sku in CATALOG}
+    hints = build_speech_hints(sales, known_aliases, hint_budget)
+    
+    rates = {}
+    for week, counts in sorted(weeks.items()):
+        rates[week] = {
+            "resolved": counts["resolved"],
+            "fuzzy": round(counts["fuzzy"] / counts["resolved"], 4),
+            "miss": round(counts["miss"] / counts["resolved"], 4)
+        }
+    
+    print(f"{records} log records, {sum(len(queries) for queries in aliases.values())} aliases learned, {len(hints)} hints")
+    for sku, queries in sorted(aliases.items()):
+        print(f"  {CATALOG[sku].name:<20}{', '.join(queries)}")
+    print(f"  {'week':<10}{'resolved':>10}{'fuzzy':>8}{'miss':>8}")
+    for week, rate in rates.items():
+        print(f"  {week:<10}{rate['resolved']:>10}{rate['fuzzy']:>8.1%}{rate['miss']:>8.1%}")
+    
+    return {
+        "generated": datetime.now().isoformat(),
+        "aliases": dict(aliases),
+        "hints": hints,
+        "sales": dict(sales),
+        "rates": rates
+    }
+
 class BartenderAgent(AgentBase):
     """AI Bartender Agent for taking drink orders"""
     
-    def __init__(self):
-        super().__init__(
-            name="Max"
-        )
+    def __init__(self, prompt_mode=None, snapshot_path=None, learned_aliases_path=None,
+                 resolution_log_path=None):
+        with startup_phase("AgentBase init"):
+            super().__init__(
+                name="Max"
+            )
         
         # Initialize app attribute
         self._app = None
@@ -180,41 +1736,86 @@ class BartenderAgent(AgentBase):
         self.host = "0.0.0.0"  # Default host
         self.port = 3030  # Default port
         
-        # Initialize TF-IDF for drink matching if available
-        self.vectorizer = None
-        self.drink_vectors = None
+        # Aliases and speech hints learned from the resolution log, and the
+        # log feeding the next round (only the server passes one, so offline
+        # tools never write scripted orders into it)
+        if learned_aliases_path is None:
+            learned_aliases_path = LEARNED_ALIASES
+        self.learned, self.learned_fingerprint = load_learned_aliases(learned_aliases_path)
+        self.resolution_log = ResolutionLog(resolution_log_path, self.near_miss)
+        
+        # Constant-time lookup tables for find_drink
+        self._build_drink_indexes()
+        
+        # Platform retries of a slow webhook return the first result
+        self.idempotency = IdempotencyCache()
+        
+        # Per-call span timelines for /debug/calls and trace export
+        self.tracer = CallTracer()
+        
+        # Concurrency limits and load shedding for the web app
+        self.admission = AdmissionController()
+        self.memory_limit = memory_limit_bytes()
+        
+        # Live tab events for the bar-side order displays
+        self.order_events = OrderEventBroker()
+        self.prep_queue = PrepQueue()
+        
+        self.prompt_mode = prompt_mode or DEFAULT_PROMPT_MODE
+        if self.prompt_mode not in PROMPT_MODES:
+            raise ValueError(f"Unknown prompt mode '{self.prompt_mode}', expected one of {PROMPT_MODES}")
+        
+        snapshot_path = snapshot_path or os.environ.get("BARTENDER_SNAPSHOT")
+        snapshot = load_snapshot(snapshot_path, self.prompt_mode, self.learned_fingerprint) if snapshot_path else None
+        
+        # Initialize TF-IDF for drink matching if available. Restoring from a
+        # snapshot is cheap; fitting imports scikit-learn, so it runs in the
+        # background and the server can come up without waiting for it.
+        self.tfidf_index = None
         self.sku_map = []
+        self.matcher_ready = threading.Event()
+        
+        if snapshot and snapshot.get("matcher"):
+            with startup_phase("restore matcher"):
+                self._restore_tfidf(snapshot["matcher"])
+        elif HAS_SKLEARN:
+            threading.Thread(target=self._initialize_tfidf, name="matcher-fit", daemon=True).start()
+        else:
+            self.matcher_ready.set()
+        
+        if snapshot:
+            with startup_phase("apply snapshot"):
+                self._apply_snapshot(snapshot)
+        else:
+            with startup_phase("build prompt and contexts"):
+                self._build_prompt()
+            with startup_phase("voice and hints"):
+                self._configure_voice()
         
-        if HAS_SKLEARN:
-            self._initialize_tfidf()
+        # Define SWAIG functions
+        with startup_phase("define functions"):
+            self._define_functions()
         
+        # Optional post-prompt URL from environment
+        post_prompt_url = os.environ.get("BARTENDER_POST_PROMPT_URL")
+        if post_prompt_url:
+            self.set_post_prompt("Summarize the conversation, including all details about the drink orders, tab total, any special requests, and customer preferences.")
+            self.set_post_prompt_url(post_prompt_url)
+
+        # Initialize global data
+        self.set_global_data({
+            "bar_name": "Outback Bar",
+            "current_time": datetime.now().strftime("%I:%M %p"),
+            "current_hour": datetime.now().hour
+        })
+    
+    def _build_prompt(self):
+        """Build the prompt sections and conversation contexts"""
         # Set personality and context
-        self.prompt_add_section(
-            "Personality",
-            "You are Max, the friendly and professional bartender at Outback Bar. You're warm and welcoming, but always responsible. "
-            "You should be casual and conversational, using phrases a real bartender would use. "
-            "Add personality to your responses - you can be a bit witty and charming, but always professional. "
-            "Remember to be concise and natural in your speech."
-        )
+        for title, body in PROMPT_SECTIONS[self.prompt_mode]:
+            self.prompt_add_section(title, body)
         
-        self.prompt_add_section(
-            "Function Usage",
-            "IMPORTANT: You don't have a memorized menu. Instead, you have access to functions that handle all drink operations:\n"
-            "- When a customer orders ANY drink, immediately use the add_drink function\n"
-            "- The function will validate if we have it and handle pricing automatically\n"
-            "- If the drink doesn't exist, the function will tell you and you can suggest alternatives\n\n"
-            "CLOSING TABS: This is a quick-service bar, not a long sit-down experience:\n"
-            "- Most customers order 1-3 drinks and close immediately\n"
-            "- Listen for completion signals: 'that's all', 'that's it', 'I'm done', 'nothing else'\n"
-            "- After 2-3 drinks, ask 'Will that be all for you?'\n"
-            "- When they indicate they're done, immediately say something like 'Perfect! Your total is $X. Ready to close out?'\n"
-            "- Don't keep tabs open indefinitely - guide them to close promptly\n\n"
-            "Example flows:\n"
-            "Customer: 'I'll have a margarita and that's it'\n"
-            "You: Use add_drink, then immediately offer to close: 'Great! That's $11.50. Ready to close out?'\n\n"
-            "Customer: 'Two beers please'\n"
-            "You: Add the beers, then ask: 'Anything else, or shall I close your tab?'"
-        )
+        bullets = STEP_BULLETS[self.prompt_mode]
         
         # Define conversation contexts
         contexts = self.define_contexts()
@@ -225,14 +1826,7 @@ class BartenderAgent(AgentBase):
         # GREETING STATE
         default_context.add_step("greeting") \
             .add_section("Current Task", "Welcome the customer and take their first order") \
-            .add_bullets("Process", [
-                "Welcome them warmly to Outback Bar",
-                "Ask what they'd like to drink",
-                "Current time: ${global_data.current_time}",
-                "If it's 4-7 PM, mention happy hour discount on cocktails",
-                "When they order ANYTHING, immediately use add_drink function",
-                "Let the function handle validation and pricing"
-            ]) \
+            .add_bullets("Process", bullets["greeting"]) \
             .set_step_criteria("Customer has ordered their first drink") \
             .set_functions(["add_drink", "check_happy_hour"]) \
             .set_valid_steps(["taking_order"])
@@ -240,19 +1834,7 @@ class BartenderAgent(AgentBase):
         # TAKING ORDER STATE
         default_context.add_step("taking_order") \
             .add_section("Current Task", "Take orders and guide toward closing") \
-            .add_bullets("Process", [
-                "Current time: ${global_data.current_time}",
-                "Current tab has ${global_data.tab_state.item_count} items",
-                "Current total: $${global_data.tab_state.total}",
-                "ALWAYS use add_drink function when customer orders",
-                "After each drink, assess if they're done:",
-                "  - 1-2 drinks: 'Anything else?'",
-                "  - 3+ drinks: 'Will that be all for you?'",
-                "Listen for completion phrases: 'that's all', 'that's it', 'I'm done'",
-                "When they indicate completion, transition to closing_tab state",
-                "Don't let tabs linger - this is quick service",
-                "If they seem done, say: 'Ready to see your total?' and move to closing_tab"
-            ]) \
+            .add_bullets("Process", bullets["taking_order"]) \
             .set_step_criteria("Customer is ordering OR has indicated they're done") \
             .set_functions(["add_drink", "remove_drink", "review_tab", "check_happy_hour"]) \
             .set_valid_steps(["closing_tab"])
@@ -260,14 +1842,7 @@ class BartenderAgent(AgentBase):
         # CLOSING TAB STATE
         default_context.add_step("closing_tab") \
             .add_section("Current Task", "Show total with tip options, then process payment") \
-            .add_bullets("Process", [
-                "IMMEDIATELY use review_tab with closing=true to show tip options",
-                "Do NOT use close_tab until AFTER review_tab shows tip options",
-                "Backend will calculate and present tip suggestions (18%, 20%, 25%)",
-                "Wait for customer to choose a tip amount",
-                "Only after customer selects tip, use close_tab with that percentage",
-                "Keep it brief and efficient"
-            ]) \
+            .add_bullets("Process", bullets["closing_tab"]) \
             .set_step_criteria("Customer has agreed to close or requested the check") \
             .set_functions(["close_tab", "review_tab"]) \
             .set_valid_steps(["tab_closed"])
@@ -275,18 +1850,13 @@ class BartenderAgent(AgentBase):
         # TAB CLOSED STATE
         default_context.add_step("tab_closed") \
             .add_section("Current Task", "Thank the customer and prepare for next customer") \
-            .add_bullets("Process", [
-                "Thank them for their business",
-                "Wish them a good day/evening",
-                "Reset for next customer"
-            ]) \
+            .add_bullets("Process", bullets["tab_closed"]) \
             .set_step_criteria("Tab has been closed and paid") \
             .set_functions([]) \
             .set_valid_steps(["greeting"])
-        
-        # Define SWAIG functions
-        self._define_functions()
-        
+    
+    def _configure_voice(self):
+        """Configure the voice and speech hints"""
         # Configure voice
         self.add_language(
             name="English",
@@ -294,91 +1864,278 @@ class BartenderAgent(AgentBase):
             voice="elevenlabs.charlie"
         )
         
-        # Add speech hints
-        self.add_hints([
-            "margarita", "old fashioned", "mojito", "martini", "cosmopolitan",
-            "manhattan", "negroni", "moscow mule", "whiskey sour", "mai tai",
-            "beer", "ipa", "lager", "stout", "pale ale", "wheat beer",
-            "wine", "red", "white", "prosecco", "pinot noir", "sauvignon blanc",
-            "vodka", "gin", "rum", "whiskey", "tequila", "bourbon",
-            "double", "rocks", "neat", "tall", "dirty", "dry",
-            "tab", "check", "close out", "pay", "tip",
-            "water", "soda", "juice", "virgin", "mocktail",
-            "that's all", "that's it", "I'm done", "nothing else", "I'm good"
-        ])
-
-        # Optional post-prompt URL from environment
-        post_prompt_url = os.environ.get("BARTENDER_POST_PROMPT_URL")
-        if post_prompt_url:
-            self.set_post_prompt("Summarize the conversation, including all details about the drink orders, tab total, any special requests, and customer preferences.")
-            self.set_post_prompt_url(post_prompt_url)
-
-        # Initialize global data
-        self.set_global_data({
-            "bar_name": "Outback Bar",
-            "current_time": datetime.now().strftime("%I:%M %p"),
-            "current_hour": datetime.now().hour
-        })
+        # Add speech hints, regenerated from sales when learned hints are loaded
+        if self.learned and self.learned.get("hints"):
+            self.add_hints(self.learned["hints"])
+        else:
+            self.add_hints(DRINK_HINTS + SERVICE_HINTS)
+    
+    def _apply_snapshot(self, snapshot):
+        """Load prompt, contexts, voice and hints from a snapshot"""
+        for section in snapshot["prompt"]:
+            self.prompt_add_section(section["title"], section.get("body", ""), bullets=section.get("bullets"))
+        
+        contexts = self.define_contexts()
+        for context_name, context_data in snapshot["contexts"].items():
+            context = contexts.add_context(context_name)
+            for section in context_data.get("pom", []):
+                context.add_section(section["title"], section["body"])
+            for step_data in context_data["steps"]:
+                step = context.add_step(step_data["name"]).set_text(step_data["text"])
+                if "step_criteria" in step_data:
+                    step.set_step_criteria(step_data["step_criteria"])
+                if "functions" in step_data:
+                    step.set_functions(step_data["functions"])
+                if "valid_steps" in step_data:
+                    step.set_valid_steps(step_data["valid_steps"])
+        
+        self.set_languages(snapshot["languages"])
+        self.add_hints(snapshot["hints"])
+    
+    def build_snapshot(self):
+        """Serialize the built agent configuration for load_snapshot"""
+        self.matcher_ready.wait()
+        
+        return {
+            "version": SNAPSHOT_VERSION,
+            "source_hash": source_fingerprint(),
+            "prompt_mode": self.prompt_mode,
+            "learned_fingerprint": self.learned_fingerprint,
+            "prompt": self.get_prompt(),
+            "contexts": self._contexts_builder.to_dict(),
+            "languages": self._languages,
+            "hints": self._hints,
+            "global_data": self._global_data,
+            "functions": list(self._tool_registry._swaig_functions),
+            "matcher": {
+                "skus": [sku for sku, item, category in self.sku_map],
+                "index": self.tfidf_index.to_dict()
+            } if self.tfidf_index else None
+        }
     
     def _initialize_tfidf(self):
         """Initialize TF-IDF vectorizer for drink matching"""
+        start = time.perf_counter()
         corpus = []
-        self.sku_map = []
+        sku_map = []
         
-        for category, items in DRINKS.items():
-            for sku, item in items.items():
-                text_parts = [item['name'], item['description']]
-                
-                if sku in DRINK_ALIASES:
-                    text_parts.extend(DRINK_ALIASES[sku])
-                
-                text_parts.append(category)
-                corpus.append(' '.join(text_parts).lower())
-                self.sku_map.append((sku, item, category))
+        for sku, item in CATALOG.items():
+            text_parts = [item.name, item.description]
+            
+            if sku in DRINK_ALIASES:
+                text_parts.extend(DRINK_ALIASES[sku])
+            
+            text_parts.append(item.category)
+            corpus.append(' '.join(text_parts).lower())
+            sku_map.append((sku, item, item.category))
         
-        self.vectorizer = TfidfVectorizer(
-            ngram_range=(1, 2),
-            stop_words=None,
-            max_features=200,
-            sublinear_tf=True
-        )
-        self.drink_vectors = self.vectorizer.fit_transform(corpus)
+        try:
+            self.tfidf_index = TfidfIndex.fit(corpus)
+            self.sku_map = sku_map
+        except Exception as e:
+            print(f"Warning: could not fit drink matcher: {e}. Fuzzy drink matching disabled.")
+        finally:
+            STARTUP_PROFILE.append(("fit matcher (background)", time.perf_counter() - start))
+            self.matcher_ready.set()
+    
+    def _restore_tfidf(self, matcher):
+        """Restore the TF-IDF matcher from a snapshot"""
+        self.sku_map = [(sku, CATALOG[sku], CATALOG[sku].category) for sku in matcher["skus"]]
+        self.tfidf_index = TfidfIndex.from_dict(matcher["index"])
+        self.matcher_ready.set()
+    
+    def _build_drink_indexes(self):
+        """Precompute the exact name, alias and phonetic lookup tables"""
+        entries = {sku: (sku, item, item.category) for sku, item in CATALOG.items()}
+        
+        self.name_index = {}
+        for sku, item, category in entries.values():
+            self.name_index.setdefault(item.name.lower(), entries[sku])
+        
+        self.alias_index = {}
+        for sku, aliases in DRINK_ALIASES.items():
+            for alias in aliases:
+                self.alias_index.setdefault(alias.lower(), entries[sku])
+        # Learned aliases never override a menu name or hand-written alias
+        for sku, aliases in (self.learned or {}).get("aliases", {}).items():
+            for alias in aliases:
+                if sku in entries and alias not in self.name_index:
+                    self.alias_index.setdefault(alias, entries[sku])
+        
+        # Keys shared by different drinks are dropped, so a phonetic hit is
+        # never a guess between two drinks
+        phonetic_skus = collections.defaultdict(set)
+        for name, entry in list(self.name_index.items()) + list(self.alias_index.items()):
+            key = phonetic_key(name)
+            if key:
+                phonetic_skus[key].add(entry[0])
+        self.phonetic_index = {
+            key: entries[next(iter(skus))] for key, skus in phonetic_skus.items() if len(skus) == 1
+        }
+        # Phonetic keys of every name and alias per drink, for near_miss
+        self.phonetic_keys = collections.defaultdict(set)
+        for key, skus in phonetic_skus.items():
+            for sku in skus:
+                self.phonetic_keys[sku].add(key)
+        
+        self._match_tiers = {
+            "exact": self.name_index.get,
+            "alias": self.alias_index.get,
+            "phonetic": lambda drink_lower: self.phonetic_index.get(phonetic_key(drink_lower)),
+            "fuzzy": self._match_fuzzy
+        }
+    
+    def _match_fuzzy(self, drink_lower):
+        """TF-IDF matching if available (skipped while the matcher is still fitting)"""
+        if not self.matcher_ready.is_set() or self.tfidf_index is None:
+            return None
+        try:
+            similarities = self.tfidf_index.similarities(drink_lower)
+            best_idx = np.argmax(similarities)
+            if similarities[best_idx] > FUZZY_MATCH_THRESHOLD:
+                return self.sku_map[best_idx]
+        except Exception:
+            pass
+        return None
+    
+    def near_miss(self, query, sku):
+        """
+        How a query that missed every tier was close to a drink: "phonetic"
+        if its phonetic key is within a few edits of the drink's name or an
+        alias, "fuzzy" if the drink was the fuzzy matcher's best candidate
+        and scored just under the match threshold, else None
+        """
+        key = phonetic_key(query)
+        if key:
+            code, vowels = key.split(":")
+            for target in self.phonetic_keys.get(sku, ()):
+                target_code, target_vowels = target.split(":")
+                distance = edit_distance(code, target_code) / max(len(code), len(target_code))
+                if distance <= NEAR_MISS_PHONETIC_DISTANCE and abs(int(vowels) - int(target_vowels)) <= 1:
+                    return "phonetic"
+        
+        if self.tfidf_index is not None and self.matcher_ready.is_set():
+            similarities = self.tfidf_index.similarities(query)
+            best = int(np.argmax(similarities))
+            if self.sku_map[best][0] == sku and similarities[best] >= NEAR_MISS_THRESHOLD:
+                return "fuzzy"
+        return None
+    
+    def resolve_drink(self, drink_name, tiers=DRINK_MATCH_TIERS, timings=None):
+        """
+        Find a drink by name, trying each lookup tier in order.
+        
+        Returns (sku, item, category, tier), or four Nones if nothing
+        matched. If timings is a dict of lists, the time spent in each
+        tier is appended to it.
+        """
+        drink_lower = drink_name.lower().strip()
+        
+        for tier in tiers:
+            with self.tracer.span(f"find_drink.{tier}", query=drink_lower) as span:
+                start = time.perf_counter()
+                entry = self._match_tiers[tier](drink_lower)
+                if timings is not None:
+                    timings[tier].append(time.perf_counter() - start)
+                if span:
+                    span.set("hit", entry[0] if entry else None)
+            if entry:
+                return (*entry, tier)
+        
+        return None, None, None, None
+    
+    def find_drinks(self, queries, tiers=DRINK_MATCH_TIERS):
+        """
+        Resolve many drink names at once.
+        
+        Each distinct normalized query goes through the lookup tiers; the
+        ones they all miss are scored by the fuzzy tier together, with one
+        matrix product, so fuzzy always runs last. Returns one
+        (sku, item, category, tier, score) per query, in order. score is 1.0
+        for a lookup hit and the best cosine similarity for a fuzzy match or
+        a miss; a miss has Nones for the rest, and a score of None if it was
+        never fuzzy scored.
+        """
+        lookup_tiers = [tier for tier in tiers if tier != "fuzzy"]
+        matches = {}
+        leftovers = []
+        for query in queries:
+            drink_lower = query.lower().strip()
+            if drink_lower in matches:
+                continue
+            for tier in lookup_tiers:
+                entry = self._match_tiers[tier](drink_lower)
+                if entry:
+                    matches[drink_lower] = (*entry, tier, 1.0)
+                    break
+            else:
+                matches[drink_lower] = (None, None, None, None, None)
+                leftovers.append(drink_lower)
+        
+        # The fuzzy tier is skipped rather than waited for while the matcher fits
+        if leftovers and "fuzzy" in tiers:
+            if self.matcher_ready.is_set() and self.tfidf_index is not None:
+                similarities = self.tfidf_index.similarity_matrix(leftovers)
+                best = similarities.argmax(axis=1)
+                for row, drink_lower in enumerate(leftovers):
+                    score = float(similarities[row, best[row]])
+                    if score > FUZZY_MATCH_THRESHOLD:
+                        matches[drink_lower] = (*self.sku_map[best[row]], "fuzzy", score)
+                    else:
+                        matches[drink_lower] = (None, None, None, None, score)
+        
+        return [matches[query.lower().strip()] for query in queries]
     
     def _define_functions(self):
         """Define all SWAIG functions for bartender operations"""
         
         def get_tab_state(raw_data):
             """Get or initialize tab state"""
-            global_data = raw_data.get("global_data", {})
-            
-            # Always update current time
-            global_data["current_time"] = datetime.now().strftime("%I:%M %p")
-            global_data["current_hour"] = datetime.now().hour
-            
-            if "tab_state" not in global_data:
-                global_data["tab_state"] = {
-                    "items": [],
-                    "subtotal": 0.00,
-                    "tax": 0.00,
-                    "total": 0.00,
-                    "item_count": 0,
-                    "alcoholic_drinks": 0,
-                    "last_drink_time": None
-                }
+            with self.tracer.span("state.get"):
+                global_data = raw_data.get("global_data", {})
+                
+                # Always update current time
+                global_data["current_time"] = datetime.now().strftime("%I:%M %p")
+                global_data["current_hour"] = datetime.now().hour
+                
+                if "tab_state" not in global_data:
+                    global_data["tab_state"] = {
+                        "items": [],
+                        "subtotal": 0.00,
+                        "tax": 0.00,
+                        "total": 0.00,
+                        "item_count": 0,
+                        "alcoholic_drinks": 0,
+                        "last_drink_time": None,
+                        "revision": 0
+                    }
+                
+                tab_state = dict(global_data["tab_state"])
+                tab_state["items"] = [TabLine.from_json(line) for line in tab_state["items"]]
             
-            return global_data["tab_state"], global_data
+            return tab_state, global_data
         
         def save_tab_state(result, tab_state, global_data):
             """Save tab state to global data"""
-            global_data["tab_state"] = tab_state
-            result.update_global_data(global_data)
+            with self.tracer.span("state.save"):
+                # Every saved change gets a new revision, so a repeat of the
+                # same order never looks like a retried webhook
+                tab_state["revision"] = tab_state.get("revision", 0) + 1
+                global_data["tab_state"] = dict(tab_state, items=[line.to_json() for line in tab_state["items"]])
+                result.update_global_data(global_data)
+        
+        def send_event(result, raw_data, tab_state, event):
+            """Send a tab event to the caller's UI and the bar displays"""
+            result.swml_user_event(event)
+            self.order_events.publish(raw_data.get("call_id"), event, tab_state)
         
         def calculate_totals(items):
             """Calculate subtotal, tax, and total"""
             # Prices already include happy hour discount if applicable
-            subtotal = round(sum(item["total"] for item in items), 2)
-            tax = round(subtotal * 0.0875, 2)  # 8.75% tax
-            total = round(subtotal + tax, 2)
+            with self.tracer.span("pricing.totals"):
+                subtotal = round(sum(line.total_cents for line in items) / 100, 2)
+                tax = round(subtotal * 0.0875, 2)  # 8.75% tax
+                total = round(subtotal + tax, 2)
             
             return subtotal, tax, total
         
@@ -390,38 +2147,11 @@ class BartenderAgent(AgentBase):
                 return True, "I'd recommend having some water with that."
             return True, None
         
-        def find_drink(drink_name):
-            """Find drink in menu by name with fuzzy matching"""
-            drink_lower = drink_name.lower().strip()
-            
-            # Check exact matches
-            for category, items in DRINKS.items():
-                for sku, item_data in items.items():
-                    if drink_lower == item_data["name"].lower():
-                        return sku, item_data, category
-            
-            # Check aliases
-            for sku, aliases in DRINK_ALIASES.items():
-                if drink_lower in [alias.lower() for alias in aliases]:
-                    for category, items in DRINKS.items():
-                        if sku in items:
-                            return sku, items[sku], category
-            
-            # TF-IDF matching if available
-            if HAS_SKLEARN and self.vectorizer and self.drink_vectors is not None:
-                try:
-                    user_vector = self.vectorizer.transform([drink_lower])
-                    similarities = cosine_similarity(user_vector, self.drink_vectors)[0]
-                    best_idx = np.argmax(similarities)
-                    best_score = similarities[best_idx]
-                    
-                    if best_score > 0.35:
-                        sku, item_data, category = self.sku_map[best_idx]
-                        return sku, item_data, category
-                except:
-                    pass
-            
-            return None, None, None
+        def find_drink(drink_name, raw_data):
+            """Find drink in menu by name with fuzzy matching, logging how it resolved"""
+            sku, item_data, category, tier = self.resolve_drink(drink_name)
+            self.resolution_log.resolved(raw_data.get("call_id"), drink_name, tier, sku)
+            return sku, item_data, category
         
         @self.tool(
             name="add_drink",
@@ -456,13 +2186,13 @@ class BartenderAgent(AgentBase):
             modifications = args.get("modifications", "")
             
             # Find the drink
-            sku, drink_data, category = find_drink(drink_name)
+            sku, drink_data, category = find_drink(drink_name, raw_data)
             
             if not sku:
                 return SwaigFunctionResult(f"Sorry, we don't have '{drink_name}' on our menu. We have cocktails, beer, wine, and non-alcoholic options. What type of drink would you prefer?")
             
             # Check drink count limit
-            current_count = sum(item["quantity"] for item in tab_state["items"])
+            current_count = sum(line.quantity for line in tab_state["items"])
             if current_count + quantity > MAX_DRINKS_PER_TAB:
                 remaining = MAX_DRINKS_PER_TAB - current_count
                 if remaining > 0:
@@ -471,66 +2201,58 @@ class BartenderAgent(AgentBase):
                     return SwaigFunctionResult(f"You've reached our {MAX_DRINKS_PER_TAB} drink limit. Your total is {dollars_to_words(tab_state['total'])}. Ready to close your tab?")
             
             # Check responsible service
-            if drink_data["abv"] > 0:
+            if drink_data.abv > 0:
                 can_serve, message = check_responsible_service(tab_state)
                 if not can_serve:
                     return SwaigFunctionResult(message)
             
-            # Calculate price with modifications
-            price = drink_data["price"]
-            if "double" in modifications.lower():
-                price += 3.00
-            
-            # Apply happy hour discount to display price
-            display_price = price
-            current_hour = datetime.now().hour
-            is_happy_hour = 16 <= current_hour < 19 and category == "cocktails"
-            if is_happy_hour:
-                display_price = round(price * 0.8, 2)  # 20% off
-            
-            # Check tab total limit
-            new_drink_total = display_price * quantity
-            projected_subtotal = tab_state["subtotal"] + new_drink_total
-            projected_tax = round(projected_subtotal * 0.0875, 2)
-            projected_total = projected_subtotal + projected_tax
+            with self.tracer.span("pricing", sku=sku):
+                # Calculate price with modifications
+                price = drink_data.price_with(modifications)
+                
+                # Apply happy hour discount to display price
+                display_price = price
+                current_hour = datetime.now().hour
+                is_happy_hour = 16 <= current_hour < 19 and category == "cocktails"
+                if is_happy_hour:
+                    display_price = round(price * 0.8, 2)  # 20% off
+                
+                # Check tab total limit
+                new_drink_total = display_price * quantity
+                projected_subtotal = tab_state["subtotal"] + new_drink_total
+                projected_tax = round(projected_subtotal * 0.0875, 2)
+                projected_total = projected_subtotal + projected_tax
             
             if projected_total > MAX_TAB_AMOUNT:
                 return SwaigFunctionResult(f"Adding this would put your tab over our {dollars_to_words(MAX_TAB_AMOUNT)} limit. Your current total is {dollars_to_words(tab_state['total'])}. Ready to close out?")
             
             # Add to tab
-            new_drink = {
-                "sku": sku,
-                "name": drink_data["name"],
-                "description": drink_data["description"],
-                "price": display_price,
-                "quantity": quantity,
-                "total": round(display_price * quantity, 2),
-                "modifications": modifications,
-                "category": category,
-                "abv": drink_data["abv"],
-                "original_price": price if is_happy_hour else None
-            }
+            new_line = TabLine(drink_data, quantity, modifications, round(display_price * 100))
             
             # Check for existing item
-            existing_item = None
-            for item in tab_state["items"]:
-                if item["sku"] == sku and item.get("modifications") == modifications:
-                    existing_item = item
+            existing_line = None
+            for line in tab_state["items"]:
+                if line.sku == sku and line.modifications == modifications:
+                    existing_line = line
                     break
             
-            if existing_item:
-                existing_item["quantity"] += quantity
-                existing_item["total"] = round(existing_item["price"] * existing_item["quantity"], 2)
-                response = f"Added another {drink_data['name']}. You now have {existing_item['quantity']}."
+            if existing_line:
+                existing_line.quantity += quantity
+                response = f"Added another {drink_data.name}. You now have {existing_line.quantity}."
             else:
-                tab_state["items"].append(new_drink)
-                response = f"Added {drink_data['name']} to your tab."
+                tab_state["items"].append(new_line)
+                response = f"Added {drink_data.name} to your tab."
             
             # Update totals
             tab_state["subtotal"], tab_state["tax"], tab_state["total"] = calculate_totals(tab_state["items"])
-            tab_state["item_count"] = sum(item["quantity"] for item in tab_state["items"])
+            tab_state["item_count"] = sum(line.quantity for line in tab_state["items"])
+            
+            # Queue for prep alongside matching drinks on other tabs
+            batch = self.prep_queue.add(raw_data.get("call_id"), sku, drink_data.name, category, modifications, quantity)
+            self.resolution_log.sold(raw_data.get("call_id"), sku, quantity)
+            self.order_events.publish(raw_data.get("call_id"), {"type": "prep_batch", **batch})
             
-            if drink_data["abv"] > 0:
+            if drink_data.abv > 0:
                 tab_state["alcoholic_drinks"] += quantity
                 tab_state["last_drink_time"] = datetime.now().isoformat()
             
@@ -540,12 +2262,14 @@ class BartenderAgent(AgentBase):
             
             # Special message for water
             if sku == "N006":
-                response = f"Added {drink_data['name']} to your tab. Stay hydrated!"
+                response = f"Added {drink_data.name} to your tab. Stay hydrated!"
             elif tab_state['total'] > 0:
                 response += f" Your tab is now {dollars_to_words(tab_state['total'])}."
             else:
                 response += " No charge!"
             
+            response += f" {ready_time_phrase(batch['ready_in'])}"
+            
             # Suggest water if needed
             if tab_state["alcoholic_drinks"] == 3:
                 response += " Can I get you some water as well?"
@@ -560,13 +2284,14 @@ class BartenderAgent(AgentBase):
             save_tab_state(result, tab_state, global_data)
             
             # Send event to UI
-            result.swml_user_event({
+            send_event(result, raw_data, tab_state, {
                 "type": "drink_added",
-                "drink": new_drink,
+                "drink": TabLine(drink_data, quantity, modifications, new_line.unit_cents).to_display_dict(),
                 "subtotal": tab_state["subtotal"],
                 "tax": tab_state["tax"],
                 "total": tab_state["total"],
-                "item_count": tab_state["item_count"]
+                "item_count": tab_state["item_count"],
+                "ready_at": batch["ready_at"]
             })
             
             return result
@@ -599,19 +2324,21 @@ class BartenderAgent(AgentBase):
             
             # Find and remove
             removed = False
-            for i, item in enumerate(tab_state["items"]):
-                if drink_name.lower() in item["name"].lower():
-                    if item["quantity"] <= quantity:
-                        if item["abv"] > 0:
-                            tab_state["alcoholic_drinks"] -= item["quantity"]
+            for i, line in enumerate(tab_state["items"]):
+                item = line.item
+                if drink_name.lower() in item.name.lower():
+                    self.prep_queue.remove(raw_data.get("call_id"), line.sku, line.modifications, quantity)
+                    self.resolution_log.removed(raw_data.get("call_id"), line.sku, min(quantity, line.quantity))
+                    if line.quantity <= quantity:
+                        if item.abv > 0:
+                            tab_state["alcoholic_drinks"] -= line.quantity
                         tab_state["items"].pop(i)
-                        response = f"Removed {item['name']} from your tab."
+                        response = f"Removed {item.name} from your tab."
                     else:
-                        item["quantity"] -= quantity
-                        item["total"] = round(item["price"] * item["quantity"], 2)
-                        if item["abv"] > 0:
+                        line.quantity -= quantity
+                        if item.abv > 0:
                             tab_state["alcoholic_drinks"] -= quantity
-                        response = f"Removed {quantity} {item['name']}. You still have {item['quantity']}."
+                        response = f"Removed {quantity} {item.name}. You still have {line.quantity}."
                     removed = True
                     break
             
@@ -620,20 +2347,20 @@ class BartenderAgent(AgentBase):
             
             # Update totals
             tab_state["subtotal"], tab_state["tax"], tab_state["total"] = calculate_totals(tab_state["items"])
-            tab_state["item_count"] = sum(item["quantity"] for item in tab_state["items"])
+            tab_state["item_count"] = sum(line.quantity for line in tab_state["items"])
             
             result = SwaigFunctionResult(response)
             save_tab_state(result, tab_state, global_data)
             
             # Send event to UI
-            result.swml_user_event({
+            send_event(result, raw_data, tab_state, {
                 "type": "drink_removed",
                 "drink_name": drink_name,
                 "quantity": quantity,
                 "subtotal": tab_state["subtotal"],
                 "tax": tab_state["tax"],
                 "total": tab_state["total"],
-                "items": tab_state["items"]
+                "items": [line.to_display_dict() for line in tab_state["items"]]
             })
             
             return result
@@ -682,9 +2409,9 @@ class BartenderAgent(AgentBase):
                 
                 result = SwaigFunctionResult(response)
                 
-                result.swml_user_event({
+                send_event(result, raw_data, tab_state, {
                     "type": "tab_review",
-                    "items": tab_state["items"],
+                    "items": [line.to_display_dict() for line in tab_state["items"]],
                     "subtotal": tab_state["subtotal"],
                     "tax": tab_state["tax"],
                     "total": tab_state["total"],
@@ -701,9 +2428,9 @@ class BartenderAgent(AgentBase):
                 
                 result = SwaigFunctionResult(response)
                 
-                result.swml_user_event({
+                send_event(result, raw_data, tab_state, {
                     "type": "tab_review",
-                    "items": tab_state["items"],
+                    "items": [line.to_display_dict() for line in tab_state["items"]],
                     "subtotal": tab_state["subtotal"],
                     "tax": tab_state["tax"],
                     "total": tab_state["total"]
@@ -785,15 +2512,162 @@ class BartenderAgent(AgentBase):
             result = SwaigFunctionResult(response)
             save_tab_state(result, tab_state, global_data)
             
-            result.swml_user_event({
+            send_event(result, raw_data, tab_state, {
                 "type": "tab_closed",
                 "final_total": final_total,
                 "tip_amount": tip_amount,
                 "tip_percent": tip_percent
             })
+            self.resolution_log.end_call(raw_data.get("call_id"))
+            
+            return result
+    
+    def prompt_size_report(self, global_data=None):
+        """
+        Measure the rendered SWML prompt for each context step.
+        
+        The model sees the base prompt sections, the context's sections, the
+        current step's text and criteria, and the definitions of the functions allowed in that step.
+        If global_data is given, ${global_data.*} variables are expanded the
+        same way the platform does before the prompt is sent.
+        """
+        swml = json.loads(self._render_swml())
+        ai = next(verb["ai"] for verb in swml["sections"]["main"] if "ai" in verb)
+        prompt = ai["prompt"]
+        
+        base_text = "\n\n".join(
+            f"## {section['title']}\n{section.get('body', '')}" for section in prompt.get("pom", [])
+        )
+        function_defs = {f["function"]: f for f in ai.get("SWAIG", {}).get("functions", [])}
+        
+        def expand(text):
+            if global_data is None:
+                return text
+            def lookup(match):
+                value = global_data
+                for key in match.group(1).split("."):
+                    if not isinstance(value, dict) or key not in value:
+                        return match.group(0)
+                    value = value[key]
+                return str(value)
+            return re.sub(r"\$\{global_data\.([\w.]+)\}", lookup, text)
+        
+        steps = {}
+        for context in prompt.get("contexts", {}).values():
+            context_text = "\n\n".join(
+                f"## {section['title']}\n{section.get('body', '')}" for section in context.get("pom", [])
+            )
+            for step in context.get("steps", []):
+                step_text = context_text + "\n\n" + expand(step.get("text", "")) + "\n" + step.get("step_criteria", "")
+                functions = step.get("functions", [])
+                if not isinstance(functions, list):
+                    functions = list(function_defs)
+                tools_text = json.dumps([function_defs[name] for name in functions if name in function_defs])
+                
+                chars = {
+                    "base": len(base_text),
+                    "step": len(step_text),
+                    "functions": len(tools_text)
+                }
+                chars["total"] = sum(chars.values())
+                steps[step["name"]] = {
+                    "chars": chars,
+                    "tokens": {part: -(-count // CHARS_PER_TOKEN) for part, count in chars.items()}
+                }
+        
+        return {"mode": self.prompt_mode, "steps": steps}
+    
+    def on_function_call(self, name, args, raw_data=None):
+        """Run SWAIG functions through the idempotency cache so retried webhooks don't repeat them"""
+        raw_data = raw_data or {}
+        call_id = raw_data.get("call_id")
+        execute = super().on_function_call
+        
+        # Without a call ID there is nothing to scope duplicates to
+        if not isinstance(call_id, str) or not call_id:
+            return execute(name, args, raw_data)
+        
+        self.tracer.bind(call_id, function=name)
+        
+        key = (call_id, swaig_request_hash(name, args, raw_data.get("global_data")))
+        with self.tracer.span("swaig.function", function=name) as span:
+            executed = []
             
+            def run():
+                executed.append(True)
+                return execute(name, args, raw_data)
+            
+            result = self.idempotency.run(key, run)
+            if span:
+                span.set("replayed", not executed)
             return result
     
+    def readiness(self):
+        """
+        Whether this instance should take new traffic, from the matcher
+        state, event loop lag, request queue and memory headroom. Cheap
+        enough to poll every second.
+        """
+        reasons = []
+        admission = self.admission
+        admission.lag_monitor.start()
+        
+        matcher_ready = self.matcher_ready.is_set()
+        if not matcher_ready:
+            reasons.append("matcher loading")
+        
+        loop_lag = admission.lag_monitor.current()
+        if loop_lag > READY_MAX_LOOP_LAG:
+            reasons.append("event loop lagging")
+        
+        queued = sum(admission.waiting.values())
+        if queued > READY_MAX_QUEUED:
+            reasons.append("request queue backed up")
+        
+        rss, available = memory_usage()
+        headroom = None
+        if rss is not None and self.memory_limit:
+            headroom = max(0.0, 1 - rss / self.memory_limit)
+        elif rss is not None and available is not None:
+            headroom = available / (available + rss)
+        if headroom is not None and headroom < READY_MIN_MEMORY_HEADROOM:
+            reasons.append("low memory")
+        
+        return {
+            "ready": not reasons,
+            "reasons": reasons,
+            "matcher": {"ready": matcher_ready, "fuzzy": self.tfidf_index is not None},
+            "loop_lag_ms": round(loop_lag * 1000, 1),
+            "in_flight": dict(admission.running),
+            "queued": queued,
+            "memory": {
+                "rss_mb": round(rss / 1048576, 1) if rss is not None else None,
+                "limit_mb": round(self.memory_limit / 1048576, 1) if self.memory_limit else None,
+                "headroom": round(headroom, 3) if headroom is not None else None
+            }
+        }
+    
+    def _render_swml(self, call_id=None, modifications=None):
+        with self.tracer.span("swml.render"):
+            return super()._render_swml(call_id, modifications)
+    
+    def render_document(self):
+        """Render the SWML document with the fast JSON backend"""
+        with self.tracer.span("response.build"):
+            return json_dumps(self.get_document()).decode()
+    
+    def route_class(self, path):
+        """Admission class for a request path, or None if it isn't limited"""
+        route = self.route.rstrip("/")
+        if path in (route, route + "/"):
+            return "swml"
+        if path.startswith(route + "/"):
+            # SWAIG and the other callbacks made during a call
+            return "swaig"
+        if path.startswith("/api/") and path not in ("/api/orders/stream", "/api/stats"):
+            return "api"
+        return None
+    
     def on_swml_request(self, request_data, callback_path, request=None):
         """Override to dynamically set video URLs based on request origin"""
         # Try to get the host from the request headers
@@ -825,6 +2699,11 @@ class BartenderAgent(AgentBase):
             self.set_param("video_talking_file", "/outback_talking.mp4")
             print("No host header found, using relative video URLs")
         
+        request_data = request_data or {}
+        call = request_data.get("call")
+        call_id = request_data.get("call_id") or (call.get("call_id") if isinstance(call, dict) else None)
+        self.tracer.bind(call_id)
+        
         # Call parent implementation
         return super().on_swml_request(request_data, callback_path, request)
     
@@ -834,17 +2713,42 @@ class BartenderAgent(AgentBase):
         Following the Holy Guacamole pattern for consistency
         """
         if self._app is None:
-            from fastapi import FastAPI, Request, Response
-            from fastapi.middleware.cors import CORSMiddleware
-            from fastapi.responses import FileResponse, JSONResponse
-            from fastapi.staticfiles import StaticFiles
+            # signalwire_agents usually imports FastAPI already
+            with startup_phase("import fastapi (cached)" if "fastapi" in sys.modules else "import fastapi"):
+                from fastapi import FastAPI, Request, Response
+                from fastapi.middleware.cors import CORSMiddleware
+                from fastapi.responses import FileResponse, JSONResponse as StdJSONResponse, StreamingResponse
+                from fastapi.staticfiles import StaticFiles
+            
+            build_start = time.perf_counter()
+            
+            class JSONResponse(StdJSONResponse):
+                """JSONResponse encoded with the fast JSON backend"""
+                def render(self, content):
+                    return json_dumps(content)
+            
+            class JSONRequest(Request):
+                """Request whose body is decoded with the fast JSON backend"""
+                async def json(self):
+                    if not hasattr(self, "_json"):
+                        self._json = json_loads(await self.body())
+                    return self._json
+            
+            def unauthorized():
+                return JSONResponse(content={"error": "Unauthorized"}, status_code=401,
+                                    headers={"WWW-Authenticate": "Basic"})
             
             # Create the FastAPI app
             app = FastAPI(
                 title="Bartender AI Agent",
-                description="AI-powered bartender assistant with Max"
+                description="AI-powered bartender assistant with Max",
+                default_response_class=JSONResponse
             )
             
+            # Admission control (added first so CORS headers wrap its responses)
+            app.add_middleware(AdmissionMiddleware, controller=self.admission,
+                               classify=self.route_class)
+            
             # Add CORS middleware
             app.add_middleware(
                 CORSMiddleware,
@@ -859,11 +2763,15 @@ class BartenderAgent(AgentBase):
             self.bot_dir = Path(__file__).parent
             self.web_dir = self.bot_dir / "web"
             
+            menu = {}
+            for item in CATALOG.values():
+                menu.setdefault(item.category, {})[item.sku] = item.to_dict()
+            
             # API Routes (before static files so they take precedence)
             @app.get("/api/menu")
             async def get_menu():
                 """Serve the drink menu from backend"""
-                return JSONResponse(content={"menu": DRINKS})
+                return JSONResponse(content={"menu": menu})
             
             @app.get("/api/info")
             async def get_info():
@@ -875,12 +2783,85 @@ class BartenderAgent(AgentBase):
                         "ui": "/",
                         "menu": "/api/menu",
                         "happy_hour": "/api/happy-hour",
+                        "open_tabs": "/api/orders/tabs",
+                        "order_stream": "/api/orders/stream",
+                        "prep_queue": "/api/prep-queue",
+                        "stats": "/api/stats",
                         "swml": "/swml",
                         "swaig": "/swml/swaig",
-                        "health": "/health"
+                        "health": "/health",
+                        "ready": "/ready",
+                        "call_traces": "/debug/calls"
                     }
                 })
             
+            @app.get("/api/orders/tabs")
+            async def get_open_tabs(request: Request):
+                """Every open tab across all calls, for bar-side displays"""
+                if not self._check_basic_auth(request):
+                    return unauthorized()
+                return JSONResponse(content=self.order_events.snapshot())
+            
+            @app.get("/api/orders/stream")
+            async def stream_orders(request: Request, since: Optional[int] = None):
+                """
+                Server-sent event stream of tab events across all calls.
+                Reconnecting displays resume with Last-Event-ID or ?since=.
+                """
+                if not self._check_basic_auth(request):
+                    return unauthorized()
+                last_event_id = request.headers.get("last-event-id")
+                if since is None and last_event_id and last_event_id.isdigit():
+                    since = int(last_event_id)
+                
+                subscriber = self.order_events.subscribe(since)
+                
+                async def event_stream():
+                    try:
+                        if subscriber.reset:
+                            yield "event: reset\ndata: {}\n\n"
+                        while True:
+                            try:
+                                await asyncio.wait_for(subscriber.ready.wait(), timeout=15)
+                            except asyncio.TimeoutError:
+                                # A quiet bar still needs tabs of callers who hung up expired
+                                self.order_events.expire_idle_tabs()
+                                yield ": keepalive\n\n"
+                                continue
+                            subscriber.ready.clear()
+                            
+                            while subscriber.queue:
+                                seq, event_type, data = subscriber.queue.popleft()
+                                yield f"id: {seq}\nevent: {event_type}\ndata: {data}\n\n"
+                            
+                            if subscriber.overflowed:
+                                yield "event: overflow\ndata: {}\n\n"
+                                break
+                    finally:
+                        self.order_events.unsubscribe(subscriber)
+                
+                return StreamingResponse(
+                    event_stream(),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+                )
+            
+            @app.get("/api/prep-queue")
+            async def get_prep_queue(request: Request):
+                """Drink batches being collected or made, with station and ready time"""
+                if not self._check_basic_auth(request):
+                    return unauthorized()
+                return JSONResponse(content={"batches": self.prep_queue.snapshot()})
+            
+            @app.get("/api/stats")
+            async def get_stats():
+                """Operational counters"""
+                return JSONResponse(content={
+                    "admission": self.admission.stats(),
+                    "idempotency": self.idempotency.stats(),
+                    "order_stream": dict(self.order_events.stats)
+                })
+            
             @app.get("/health")
             async def health_check():
                 return JSONResponse(content={
@@ -888,6 +2869,29 @@ class BartenderAgent(AgentBase):
                     "agent": self.get_name()
                 })
             
+            @app.get("/ready")
+            async def ready_check():
+                """Readiness for load balancers and autoscalers: 200 when ready, 503 when not"""
+                readiness = self.readiness()
+                return JSONResponse(content=readiness, status_code=200 if readiness["ready"] else 503)
+            
+            @app.get("/debug/calls")
+            async def list_traced_calls(request: Request):
+                """Calls with timelines in the trace ring buffer, most recent first"""
+                if not self._check_basic_auth(request):
+                    return unauthorized()
+                return JSONResponse(content={"calls": self.tracer.recent_calls()})
+            
+            @app.get("/debug/calls/{call_id}")
+            async def get_call_trace(call_id: str, request: Request):
+                """Per-request span timeline for a recent call"""
+                if not self._check_basic_auth(request):
+                    return unauthorized()
+                timeline = self.tracer.timeline(call_id)
+                if timeline is None:
+                    return JSONResponse(content={"error": f"No trace for call {call_id}"}, status_code=404)
+                return JSONResponse(content=timeline)
+            
             @app.get("/api/happy-hour")
             async def get_happy_hour():
                 """Check if happy hour is active"""
@@ -899,6 +2903,21 @@ class BartenderAgent(AgentBase):
                     "message": "Happy Hour! 20% off cocktails!" if is_active else "Regular prices"
                 })
             
+            # SWAIG tool calls, ahead of the SDK router so the body is decoded
+            # and the result encoded with the fast JSON backend. The call ID is
+            # bound to the trace in on_function_call, after the SDK's checks.
+            @app.post(f"{self.route}/swaig")
+            @app.post(f"{self.route}/swaig/")
+            async def handle_swaig(request: Request, response: Response):
+                """Handle SWAIG function calls"""
+                request = JSONRequest(request.scope, request.receive)
+                with self.tracer.request("swaig"):
+                    result = await self._handle_swaig_request(request, response)
+                    if isinstance(result, dict):
+                        with self.tracer.span("response.build"):
+                            return JSONResponse(content=result)
+                    return result
+            
             # Create router for SWML endpoints
             router = self.as_router()
             
@@ -909,7 +2928,9 @@ class BartenderAgent(AgentBase):
             @app.post("/swml")
             async def handle_swml(request: Request, response: Response):
                 """Handle POST to /swml - SignalWire's webhook endpoint"""
-                return await self._handle_root_request(request)
+                request = JSONRequest(request.scope, request.receive)
+                with self.tracer.request("swml"):
+                    return await self._handle_root_request(request)
             
             # Optionally also handle GET for testing
             @app.get("/swml")
@@ -923,6 +2944,7 @@ class BartenderAgent(AgentBase):
                 app.mount("/", StaticFiles(directory=str(self.web_dir), html=True), name="static")
             
             self._app = app
+            STARTUP_PROFILE.append(("build app routes", time.perf_counter() - build_start))
         
         return self._app
     
@@ -953,10 +2975,16 @@ class BartenderAgent(AgentBase):
         print(f"  Web UI:      http://{host}:{port}/")
         print(f"  Menu API:    http://{host}:{port}/api/menu")
         print(f"  Happy Hour:  http://{host}:{port}/api/happy-hour")
+        print(f"  Open Tabs:   http://{host}:{port}/api/orders/tabs")
+        print(f"  Order Feed:  http://{host}:{port}/api/orders/stream")
+        print(f"  Prep Queue:  http://{host}:{port}/api/prep-queue")
+        print(f"  Stats:       http://{host}:{port}/api/stats")
         print(f"  System API:  http://{host}:{port}/api/info")
         print(f"  SWML:        http://{host}:{port}/swml")
         print(f"  SWAIG:       http://{host}:{port}/swml/swaig")
         print(f"  Health:      http://{host}:{port}/health")
+        print(f"  Ready:       http://{host}:{port}/ready")
+        print(f"  Call Traces: http://{host}:{port}/debug/calls")
         print("=" * 60)
         print("\nPress Ctrl+C to stop\n")
         
@@ -967,15 +2995,412 @@ class BartenderAgent(AgentBase):
             print("\n🛑 Stopping Outback Bar server...")
             print("Thank you for visiting Outback Bar! 🍸")
 
+def compare_prompt_modes(modes=PROMPT_MODES, conversations=None):
+    """
+    Run the scripted conversations against each prompt mode and total the
+    prompt tokens sent to the model, turn by turn.
+    
+    Tool calls are executed for real so the tab variables in the step
+    prompts expand to the values the caller would see.
+    """
+    conversations = conversations or SCRIPTED_CONVERSATIONS
+    report = {}
+    
+    for mode in modes:
+        agent = BartenderAgent(prompt_mode=mode)
+        static_report = agent.prompt_size_report()
+        mode_report = {"steps": static_report["steps"], "conversations": {}}
+        
+        for convo_name, turns in conversations.items():
+            global_data = dict(agent._global_data)
+            prompt_tokens = 0
+            
+            for step_name, tool_call in turns:
+                step_report = agent.prompt_size_report(global_data)["steps"][step_name]
+                prompt_tokens += step_report["tokens"]["total"]
+                
+                if tool_call:
+                    function_name, args = tool_call
+                    result = agent.on_function_call(function_name, args, {"global_data": global_data})
+                    if isinstance(result, SwaigFunctionResult):
+                        for action in result.to_dict().get("action", []):
+                            if "set_global_data" in action:
+                                global_data = action["set_global_data"]
+            
+            mode_report["conversations"][convo_name] = {
+                "turns": len(turns),
+                "prompt_tokens": prompt_tokens,
+                "tokens_per_turn": round(prompt_tokens / len(turns), 1)
+            }
+        
+        report[mode] = mode_report
+    
+    return report
+
+def print_prompt_report(report):
+    """Print a prompt mode comparison as plain tables"""
+    modes = list(report)
+    
+    print("Prompt size per step (chars / est. tokens)")
+    print(f"  {'step':<14}" + "".join(f"{mode:>22}" for mode in modes))
+    for step_name in report[modes[0]]["steps"]:
+        row = f"  {step_name:<14}"
+        for mode in modes:
+            step = report[mode]["steps"][step_name]
+            row += f"{step['chars']['total']:>14} / {step['tokens']['total']:<5}"
+        print(row)
+    
+    print("\nScripted conversations (prompt tokens sent to the model)")
+    print(f"  {'conversation':<22}" + "".join(f"{mode:>12}" for mode in modes) + "     saved")
+    for convo_name in report[modes[0]]["conversations"]:
+        totals = [report[mode]["conversations"][convo_name]["prompt_tokens"] for mode in modes]
+        saved = f"{(1 - totals[-1] / totals[0]) * 100:.0f}%" if totals[0] else "-"
+        print(f"  {convo_name:<22}" + "".join(f"{total:>12}" for total in totals) + f"{saved:>10}")
+
+
+def evaluate_matching(corpus_path, agent=None):
+    """
+    Run the labeled speech recognition noise corpus through find_drink's
+    tiers, with and without the phonetic tier, and report hit rate and
+    per-tier lookup latency.
+    """
+    with open(corpus_path) as f:
+        corpus = json.load(f)
+    
+    agent = agent or BartenderAgent()
+    agent.matcher_ready.wait()
+    
+    configurations = {
+        "without phonetic": tuple(tier for tier in DRINK_MATCH_TIERS if tier != "phonetic"),
+        "with phonetic": DRINK_MATCH_TIERS
+    }
+    
+    for label, tiers in configurations.items():
+        timings = collections.defaultdict(list)
+        resolved = collections.Counter()
+        correct = collections.Counter()
+        kinds = collections.defaultdict(lambda: [0, 0])
+        
+        for row in corpus:
+            sku, item, category, tier = agent.resolve_drink(row["utterance"], tiers, timings)
+            resolved[tier or "miss"] += 1
+            is_correct = sku == row["sku"]
+            correct[tier or "miss"] += is_correct
+            kinds[row["kind"]][0] += is_correct
+            kinds[row["kind"]][1] += 1
+        
+        total_correct = sum(correct.values())
+        print(f"{label}: {total_correct}/{len(corpus)} correct ({total_correct / len(corpus):.0%})")
+        for kind, (kind_correct, kind_total) in kinds.items():
+            print(f"  {kind:<10}{kind_correct:>4}/{kind_total:<4}")
+        print(f"  {'tier':<10}{'resolved':>9}{'correct':>9}{'mean us':>10}")
+        for tier in list(tiers) + ["miss"]:
+            samples = timings.get(tier, [])
+            mean_us = f"{sum(samples) / len(samples) * 1e6:.1f}" if samples else "-"
+            print(f"  {tier:<10}{resolved[tier]:>9}{correct[tier]:>9}{mean_us:>10}")
+        print()
+    
+    # The whole corpus resolved one query at a time versus in one find_drinks
+    # batch, through every tier and through the fuzzy tier alone
+    utterances = [row["utterance"] for row in corpus]
+    rounds = 50
+    total = len(utterances) * rounds
+    print(f"resolving {len(utterances)} utterances x {rounds} (utterances/s):")
+    print(f"  {'tiers':<10}{'one at a time':>15}{'find_drinks':>13}  same matches")
+    for label, tiers in (("all", DRINK_MATCH_TIERS), ("fuzzy", ("fuzzy",))):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            single = [agent.resolve_drink(utterance, tiers)[0] for utterance in utterances]
+        single_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(rounds):
+            batch = [match[0] for match in agent.find_drinks(utterances, tiers)]
+        batch_seconds = time.perf_counter() - start
+        print(f"  {label:<10}{total / single_seconds:>15,.0f}{total / batch_seconds:>13,.0f}  {single == batch}")
+
+def _build_large_tab(agent, call_id):
+    """Order a 20-drink tab through add_drink; returns the final global_data and result"""
+    orders = [
+        ("margarita", 1, ""), ("old fashioned", 1, "double"), ("ipa", 1, ""), ("house red", 1, ""),
+        ("negroni", 1, ""), ("virgin mojito", 2, ""), ("shirley temple", 2, ""), ("virgin mary", 1, ""),
+        ("coke", 2, ""), ("soda", 1, "tall"), ("juice", 2, ""), ("juice", 1, "no ice"),
+        ("water", 2, ""), ("water", 2, "sparkling")
+    ]
+    
+    global_data = {}
+    result = None
+    for drink_name, quantity, modifications in orders:
+        args = {"drink_name": drink_name, "quantity": quantity, "modifications": modifications}
+        result = agent.on_function_call("add_drink", args, {"call_id": call_id, "global_data": global_data})
+        for action in result.to_dict().get("action", []):
+            if "set_global_data" in action:
+                global_data = action["set_global_data"]
+    return global_data, result
+
+def measure_tab_payload(agent=None):
+    """
+    Build a 20-drink tab through add_drink and compare the per-turn SWAIG
+    payload (global_data in the request, the result in the response) of
+    compact tab lines against the full display dicts they replaced.
+    """
+    agent = agent or BartenderAgent()
+    global_data, result = _build_large_tab(agent, "payload-report")
+    
+    def expanded(data):
+        tab_state = dict(data["tab_state"], items=[TabLine.from_json(line).to_display_dict() for line in data["tab_state"]["items"]])
+        return dict(data, tab_state=tab_state)
+    
+    response = result.to_dict()
+    legacy_response = dict(response, action=[
+        {"set_global_data": expanded(action["set_global_data"])} if "set_global_data" in action else action
+        for action in response["action"]
+    ])
+    
+    sizes = {
+        "full dicts": (len(json.dumps(expanded(global_data))), len(json.dumps(legacy_response))),
+        "compact lines": (len(json.dumps(global_data)), len(json.dumps(response)))
+    }
+    
+    tab_state = global_data["tab_state"]
+    print(f"Tab: {tab_state['item_count']} drinks on {len(tab_state['items'])} lines")
+    print(f"  {'format':<16}{'request':>10}{'response':>10}{'per turn':>10}  (bytes)")
+    for label, (request_size, response_size) in sizes.items():
+        print(f"  {label:<16}{request_size:>10}{response_size:>10}{request_size + response_size:>10}")
+    return sizes
+
+def json_benchmark(agent=None, rounds=2000):
+    """
+    Time encode and decode of realistic large-tab payloads with each
+    available JSON backend: a SWAIG request carrying a 20-drink tab in
+    global_data, the add_drink result with its global_data and
+    swml_user_event actions, an order stream event with the expanded tab,
+    and the rendered SWML document.
+    """
+    import timeit
+    from fastapi.encoders import jsonable_encoder
+    
+    agent = agent or BartenderAgent()
+    global_data, result = _build_large_tab(agent, "json-benchmark")
+    args = {"drink_name": "margarita", "quantity": 1, "modifications": ""}
+    tab_state = global_data["tab_state"]
+    payloads = {
+        "SWAIG request": {
+            "function": "add_drink", "call_id": "json-benchmark", "global_data": global_data,
+            "argument": {"parsed": [args], "raw": json.dumps(args)}
+        },
+        "SWAIG response": result.to_dict(),
+        "order event": {
+            "seq": 1, "call_id": "json-benchmark", "time": datetime.now().isoformat(),
+            "event": {"type": "drink_added"}, "total": tab_state["total"],
+            "items": [TabLine.from_json(line).to_display_dict() for line in tab_state["items"]]
+        },
+        "SWML document": json_loads(agent._render_swml("json-benchmark"))
+    }
+    
+    def per_call_us(fn):
+        return timeit.timeit(fn, number=rounds) / rounds * 1e6
+    
+    report = {}
+    print(f"Payloads: {tab_state['item_count']}-drink tab, {rounds} rounds each; default backend: {JSON_BACKEND}")
+    print(f"  {'payload':<16}{'bytes':>8}  {'backend':<10}{'encode':>10}{'decode':>10}  (us)")
+    for label, payload in payloads.items():
+        for name, (encode, decode) in JSON_BACKENDS.items():
+            data = encode(payload)
+            encode_us = per_call_us(lambda: encode(payload))
+            decode_us = per_call_us(lambda: decode(data))
+            report[(label, name)] = (len(data), encode_us, decode_us)
+            print(f"  {label:<16}{len(data):>8}  {name:<10}{encode_us:>10.1f}{decode_us:>10.1f}")
+    
+    # SWAIG results used to go through FastAPI's jsonable_encoder before json.dumps
+    swaig_response = payloads["SWAIG response"]
+    legacy_us = per_call_us(lambda: json.dumps(jsonable_encoder(swaig_response)))
+    report[("SWAIG response", "legacy")] = (None, legacy_us, None)
+    print(f"  {'SWAIG response':<16}{'':>8}  {'legacy':<10}{legacy_us:>10.1f}{'':>10}  (jsonable_encoder + json.dumps)")
+    return report
+
+def _build_open_tabs(representation, tab_count, trace, conn):
+    """Child process for memory_benchmark: hold tab_count open tabs and report memory use"""
+    import gc
+    import tracemalloc
+    
+    def rss_bytes():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    
+    lines = [
+        TabLine(CATALOG["C001"], 2, "", 1000),
+        TabLine(CATALOG["B001"], 1, "", 700),
+        TabLine(CATALOG["C002"], 1, "double", 1500),
+        TabLine(CATALOG["N006"], 1, "", 0)
+    ]
+    if representation == "dicts":
+        wire = json.dumps([line.to_display_dict() for line in lines])
+        parse = json.loads
+    else:
+        wire = json.dumps([line.to_json() for line in lines])
+        parse = lambda data: [TabLine.from_json(line) for line in json.loads(data)]
+    
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    rss_before = rss_bytes()
+    
+    # Each tab is decoded separately, the way it arrives in global_data
+    tabs = {f"call-{i}": {"items": parse(wire), "total": 45.67, "item_count": 5} for i in range(tab_count)}
+    
+    if trace:
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.statistics("filename")
+        conn.send({
+            "allocated": sum(stat.size for stat in stats),
+            "blocks": sum(stat.count for stat in stats)
+        })
+    else:
+        conn.send({"rss": rss_bytes() - rss_before})
+    conn.close()
+    del tabs
+
+def memory_benchmark(tab_count=10000):
+    """
+    Hold tab_count concurrent open tabs in-process, as full line dicts and
+    as TabLine records, and report RSS growth and allocations for each.
+    Every measurement runs in a fresh process.
+    """
+    import multiprocessing
+    
+    results = {}
+    for representation in ("dicts", "records"):
+        results[representation] = {}
+        for trace in (False, True):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_build_open_tabs, args=(representation, tab_count, trace, child))
+            process.start()
+            results[representation].update(parent.recv())
+            process.join()
+    
+    print(f"{tab_count} open tabs, 4 lines each")
+    print(f"  {'lines as':<10}{'RSS MB':>10}{'traced MB':>11}{'blocks':>10}{'bytes/tab':>11}")
+    for representation, result in results.items():
+        print(f"  {representation:<10}{result['rss'] / 2**20:>10.1f}{result['allocated'] / 2**20:>11.1f}"
+              f"{result['blocks']:>10}{result['allocated'] // tab_count:>11}")
+    return results
+
+def profile_startup(prompt_mode=None, snapshot_path=None):
+    """
+    Build the agent and app, serve one /health request in-process, and
+    print how long each import and init phase took.
+    """
+    agent = BartenderAgent(prompt_mode=prompt_mode, snapshot_path=snapshot_path)
+    app = agent.get_app()
+    
+    async def get_health():
+        status = {}
+        
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+        
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+        
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": "/health", "raw_path": b"/health",
+            "root_path": "", "query_string": b"", "headers": [],
+            "server": ("localhost", 80), "client": ("127.0.0.1", 0)
+        }
+        await app(scope, receive, send)
+        return status.get("code")
+    
+    with startup_phase("first /health"):
+        health_status = asyncio.run(get_health())
+    ready_at = time.perf_counter() - MODULE_START
+    
+    agent.matcher_ready.wait()
+    
+    print("Startup profile")
+    for phase, seconds in STARTUP_PROFILE:
+        print(f"  {phase:<28}{seconds * 1000:>9.1f} ms")
+    print(f"\n  Module import to first /health {health_status}: {ready_at * 1000:.1f} ms")
+    if snapshot_path:
+        print(f"  Snapshot: {snapshot_path}")
+
 if __name__ == "__main__":
-    import os
+    import argparse
     
-    # Create agent instance
-    agent = BartenderAgent()
+    parser = argparse.ArgumentParser(description="Outback Bar AI bartender")
+    parser.add_argument("--host", default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument("--port", type=int, default=int(os.environ.get('PORT', 3030)))
+    parser.add_argument("--prompt-mode", choices=PROMPT_MODES, default=DEFAULT_PROMPT_MODE,
+                        help="Prompt wording to serve (default: $BARTENDER_PROMPT_MODE or full)")
+    parser.add_argument("--prompt-report", action="store_true",
+                        help="Print prompt sizes per step for each mode on the scripted conversations and exit")
+    parser.add_argument("--snapshot", default=os.environ.get("BARTENDER_SNAPSHOT"),
+                        help="Load the agent configuration from this snapshot file (default: $BARTENDER_SNAPSHOT)")
+    parser.add_argument("--write-snapshot", metavar="PATH",
+                        help="Build the agent, write its configuration snapshot to PATH and exit")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Report the time spent in each import and init phase and exit")
+    parser.add_argument("--evaluate-matching", nargs="?", const="asr_noise_corpus.json", metavar="CORPUS",
+                        help="Report drink matching hit rate and latency per tier on a labeled corpus and exit")
+    parser.add_argument("--learn-aliases", nargs="+", metavar="LOG",
+                        help="Learn aliases and sales-weighted hints from resolution logs, write them to "
+                             "$LEARNED_ALIASES (default learned_aliases.json) and exit")
+    parser.add_argument("--json-benchmark", action="store_true",
+                        help="Time JSON encode/decode of large-tab payloads with each available backend and exit")
+    parser.add_argument("--tab-payload-report", action="store_true",
+                        help="Compare the per-turn SWAIG payload of a 20-drink tab in compact and full formats and exit")
+    parser.add_argument("--memory-benchmark", nargs="?", type=int, const=10000, metavar="TABS",
+                        help="Compare memory held by open tabs as dicts and as TabLine records and exit")
+    args = parser.parse_args()
+    
+    if args.memory_benchmark:
+        memory_benchmark(args.memory_benchmark)
+        sys.exit(0)
+    
+    if args.tab_payload_report:
+        measure_tab_payload()
+        sys.exit(0)
     
-    # Get port from environment variable or use 3030 as default
-    port = int(os.environ.get('PORT', 3030))
-    host = os.environ.get('HOST', '0.0.0.0')
+    if args.learn_aliases:
+        output_path = LEARNED_ALIASES or "learned_aliases.json"
+        previous, _ = load_learned_aliases(output_path) if os.path.exists(output_path) else (None, None)
+        learned = learn_aliases(args.learn_aliases, previous)
+        with open(output_path, "wb") as f:
+            f.write(json_dumps(learned))
+        print(f"Wrote {output_path}")
+        sys.exit(0)
+    
+    if args.json_benchmark:
+        json_benchmark()
+        sys.exit(0)
+    
+    if args.evaluate_matching:
+        evaluate_matching(args.evaluate_matching)
+        sys.exit(0)
+    
+    if args.prompt_report:
+        print_prompt_report(compare_prompt_modes())
+        sys.exit(0)
+    
+    if args.profile_startup:
+        profile_startup(prompt_mode=args.prompt_mode, snapshot_path=args.snapshot)
+        sys.exit(0)
+    
+    if args.write_snapshot:
+        agent = BartenderAgent(prompt_mode=args.prompt_mode)
+        with open(args.write_snapshot, "w") as f:
+            json.dump(agent.build_snapshot(), f)
+        print(f"Wrote snapshot to {args.write_snapshot}")
+        sys.exit(0)
+    
+    # Create agent instance
+    agent = BartenderAgent(prompt_mode=args.prompt_mode, snapshot_path=args.snapshot,
+                           resolution_log_path=RESOLUTION_LOG)
     
-    print(f"Starting server on {host}:{port}")
-    agent.serve(host=host, port=port)
\ No newline at end of file
+    print(f"Starting server on {args.host}:{args.port}")
+    agent.serve(host=args.host, port=args.port)